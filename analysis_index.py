@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+from pipeline import DAILY_AGGREGATIONS
+
+# Rollups are kept per calendar granularity; the keys are the labels shown in the UI.
+ROLLUP_FREQUENCIES = {"Day": "D", "Week": "W-MON", "Month": "MS"}
+
+
+def rollup_dimensions(data):
+    """Flavour and promotion columns, the dimensions the rollup cube is broken down by."""
+    return [column for column in data.columns
+            if any(word in column.lower() for word in ("flavour", "flavor", "promotion"))
+            and not pd.api.types.is_float_dtype(data[column])]
+
+
+class AnalysisIndex:
+    """Filter and aggregation structures for the Analyze Data page, built once per upload.
+
+    Filter columns are dictionary encoded so a filter is one lookup into a small boolean
+    table, dates are kept sorted so a date range is two binary searches, and numeric
+    columns are pre-aggregated per day, week and month for every flavour/promotion pair.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._codes = {}
+        self.dimensions = rollup_dimensions(data)
+        self.measures = [column for column in data.columns
+                         if column != 'Date' and column not in self.dimensions
+                         and pd.api.types.is_numeric_dtype(data[column])
+                         and not pd.api.types.is_bool_dtype(data[column])]
+
+        self.dates = None
+        self.rollups = {}
+        if 'Date' in data.columns:
+            dates = pd.to_datetime(data['Date']).to_numpy()
+            self.date_order = np.argsort(dates, kind='stable')
+            self.dates = dates[self.date_order]
+            self.rollups = self._build_rollups(data.assign(Date=dates))
+
+    def _build_rollups(self, data):
+        columns = {'Rows': ('Date', 'size')}
+        for measure in self.measures:
+            columns[measure] = (measure, 'sum')
+            if DAILY_AGGREGATIONS.get(measure, 'sum') == 'mean':
+                columns[f"{measure} count"] = (measure, 'count')
+        rollups = {}
+        for label, freq in ROLLUP_FREQUENCIES.items():
+            keys = [pd.Grouper(key='Date', freq=freq, label='left', closed='left')] + self.dimensions
+            # Rows with a missing flavour or promotion still count towards the unfiltered totals.
+            cube = data.groupby(keys, observed=True, dropna=False).agg(**columns)
+            rollups[label] = cube[cube['Rows'] > 0].reset_index()
+        return rollups
+
+    def codes(self, column):
+        """Integer code per row and the distinct values they index, computed on first use."""
+        if column not in self._codes:
+            codes, uniques = pd.factorize(self.data[column], sort=True)
+            self._codes[column] = (codes, pd.Index(uniques))
+        return self._codes[column]
+
+    def values(self, column):
+        return self.codes(column)[1]
+
+    @property
+    def nbytes(self):
+        """Memory held by the index itself, not counting the upload it indexes."""
+        arrays = [codes for codes, _ in self._codes.values()]
+        if self.dates is not None:
+            arrays += [self.date_order, self.dates]
+        cubes = sum(int(cube.memory_usage(deep=True).sum()) for cube in self.rollups.values())
+        return sum(array.nbytes for array in arrays) + cubes
+
+    @property
+    def date_range(self):
+        return pd.Timestamp(self.dates[0]), pd.Timestamp(self.dates[-1])
+
+    def mask(self, start=None, end=None, filters=None):
+        """Boolean row mask for an inclusive date range and {column: selected values} filters."""
+        n = len(self.data)
+        if self.dates is not None and (start is not None or end is not None):
+            lo = 0 if start is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start)), side='left')
+            hi = n if end is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end)), side='right')
+            mask = np.zeros(n, dtype=bool)
+            mask[self.date_order[lo:hi]] = True
+        else:
+            mask = np.ones(n, dtype=bool)
+
+        for column, selected in (filters or {}).items():
+            codes, uniques = self.codes(column)
+            # One extra slot at the end catches code -1 (missing values), which never matches.
+            allowed = np.zeros(len(uniques) + 1, dtype=bool)
+            positions = uniques.get_indexer(pd.Index(selected))
+            allowed[positions[positions >= 0]] = True
+            mask &= allowed[codes]
+        return mask
+
+    def select(self, mask):
+        """Rows of the upload under mask; the upload itself is returned when nothing is filtered out."""
+        return self.data if mask.all() else self.data[mask]
+
+    def can_answer(self, x_axis, y_axis, filters):
+        """Whether a chart of y against Date under these filters can be drawn from the rollups."""
+        return (bool(self.rollups) and x_axis == 'Date' and y_axis in self.measures
+                and all(column in self.dimensions for column in (filters or {})))
+
+    def rollup(self, granularity, y_axis, start=None, end=None, filters=None):
+        """One row per period with y aggregated like the forecast does: volumes summed, the rest averaged.
+
+        The week and month cubes are used directly when the date range covers whole
+        periods; otherwise the day cube is filtered and regrouped so the result is exact.
+        """
+        freq = ROLLUP_FREQUENCIES[granularity]
+        offset = pd.tseries.frequencies.to_offset(freq)
+        first, last = self.date_range
+        start = first if start is None else max(pd.Timestamp(start), first)
+        end = last if end is None else min(pd.Timestamp(end), last)
+        whole_periods = offset.is_on_offset(start) and offset.is_on_offset(end + pd.Timedelta(days=1))
+
+        if granularity != "Day" and (whole_periods or (start == first and end == last)):
+            cube = self.rollups[granularity]
+            lower = offset.rollback(start)
+        else:
+            cube = self.rollups["Day"]
+            lower = start.floor('D')
+        dates = cube['Date'].to_numpy()
+        mask = (dates >= np.datetime64(lower)) & (dates <= np.datetime64(end))
+        for column, selected in (filters or {}).items():
+            # Like mask(), a missing value never matches a filter.
+            mask &= (cube[column].isin(selected) & cube[column].notna()).to_numpy()
+
+        mean = DAILY_AGGREGATIONS.get(y_axis, 'sum') == 'mean'
+        columns = [y_axis, f"{y_axis} count"] if mean else [y_axis]
+        selected = cube.loc[mask, ['Date'] + columns]
+        grouped = selected.groupby(pd.Grouper(key='Date', freq=freq, label='left', closed='left'))[columns].sum()
+        if mean:
+            grouped[y_axis] = grouped[y_axis] / grouped[f"{y_axis} count"].where(lambda count: count > 0)
+        return grouped[[y_axis]].reset_index()
@@ -1,20 +1,21 @@
 import streamlit as st
 import hashlib
-import subprocess
-subprocess.run(["pip", "install", "-r", "requirements.txt"], check=True)
-
-# Local module imports
-try:
-    from data_preview import data_preview
-    from trend_analysis import trend_analysis
-    from forecasting import forecast
-    from model_accuracy import evaluate_model
-except ModuleNotFoundError as e:
-    st.error(f"Module import error: {e}")
-    st.stop()
+import importlib
+import time
 
 st.set_page_config(page_title="FLAVOUR FORECAST - Potato Chips Demand Forecasting Tool", layout="wide")
 
+# Local module imports happen only when their section is opened, so the login and home
+# pages never pay for statsmodels, scikit-learn or plotly. Python caches the modules after
+# the first import, so later reruns are free.
+def load_section(module_name, *names):
+    try:
+        module = importlib.import_module(module_name)
+    except ModuleNotFoundError as e:
+        st.error(f"Module import error: {e}")
+        st.stop()
+    return [getattr(module, name) for name in names]
+
 # Admin credentials
 USERNAME = "admin"
 PASSWORD_HASH = hashlib.sha256("adminpass".encode()).hexdigest()
@@ -54,6 +55,8 @@ else:
 
     st.sidebar.title("Navigation")
     page = st.sidebar.selectbox("Select a Section", ["Home", "Upload Data", "Analyze Data", "Forecast Data", "Model's Accuracy"])
+    show_diagnostics = st.sidebar.checkbox("Show Diagnostics", help="Time, CPU and memory used by each stage of this page.")
+    run_started = time.time()
 
     if page == "Home":
         st.markdown("### Welcome to FLAVOUR FORECAST!")
@@ -82,10 +85,17 @@ else:
     elif page == "Upload Data":
         st.header("Upload Your Dataset")
         st.write("Upload a dataset to begin analyzing trends and forecasting demand.")
-        data = data_preview()
-        if data is not None:
-            st.session_state['data'] = data
+        data_preview, = load_section("data_preview", "data_preview")
+        handle = data_preview()
+        if handle is not None:
+            # Sessions keep a handle to the shared, read-only copy in the dataset store, not the data itself
+            st.session_state['data'] = handle
             st.success("Data uploaded successfully!")
+            if st.session_state.get('refreshed_data') != handle.key:
+                # Start the shared SARIMAX forecasts now, so they are ready by the time someone opens Forecast Data
+                get_forecast_store, refresh_dataset = load_section("forecast_store", "get_forecast_store", "refresh_dataset")
+                refresh_dataset(get_forecast_store(), handle.name, handle.data)
+                st.session_state['refreshed_data'] = handle.key
         else:
             st.warning("Please upload a valid dataset.")
 
@@ -93,7 +103,8 @@ else:
         st.header("Data Analysis")
         st.write("Gain insights into historical trends, seasonality, and demand drivers.")
         if 'data' in st.session_state and st.session_state['data'] is not None:
-            trend_analysis(st.session_state['data'])
+            trend_analysis, = load_section("trend_analysis", "trend_analysis")
+            trend_analysis(st.session_state['data'].data, st.session_state['data'].key)
         else:
             st.warning("Please upload a dataset in the 'Upload Data' section first.")
 
@@ -101,13 +112,26 @@ else:
         st.header("Demand Forecasting")
         st.write("Predict future demand using historical data and influencing factors.")
         if 'data' in st.session_state and st.session_state['data'] is not None:
-            forecast(st.session_state['data'])
+            forecast, batch_forecast_view = load_section("forecasting", "forecast", "batch_forecast_view")
+            handle = st.session_state['data']
+            # Keep the forecast and its holdout for the Model's Accuracy page
+            st.session_state['forecast_values'], st.session_state['test_data'] = forecast(handle.data, handle.name)
+            st.write("---")
+            batch_forecast_view(st.session_state['data'].data)
         else:
             st.warning("Please upload a dataset in the 'Upload Data' section first.")
 
     elif page == "Model's Accuracy":
         st.header("Model's Accuracy Evaluation")
+        evaluate_model, backtest_view = load_section("model_accuracy", "evaluate_model", "backtest_view")
+        has_data = 'data' in st.session_state and st.session_state['data'] is not None
         if 'forecast_values' in st.session_state and 'test_data' in st.session_state:
             evaluate_model(st.session_state['forecast_values'], st.session_state['test_data'])
+        if has_data:
+            backtest_view(st.session_state['data'].data, st.session_state['data'].name)
         else:
-            st.warning("Please perform forecasting in the 'Forecast Data' section first.")
+            st.warning("Please upload a dataset in the 'Upload Data' section first.")
+
+    if show_diagnostics:
+        diagnostics_panel, = load_section("diagnostics", "diagnostics_panel")
+        diagnostics_panel(run_started)
@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from fast_models import forecast_matrix, forecast_one, to_matrix
+from instrumentation import timed
+from pipeline import ORDER, SEASONAL_ORDER, fit_sarimax, to_daily
+from worker_pool import map_with_timeout
+
+DEFAULT_TIMEOUT = 120
+# 'sarimax' fits one statsmodels model per group; the other names are the vectorized models in fast_models.
+BATCH_MODELS = ['sarimax', 'snaive', 'ets', 'ma']
+FALLBACK_MODEL = 'ets'
+
+
+def split_series(data, group_columns, target):
+    """Split the upload into one daily target series per combination of the grouping columns."""
+    series = {}
+    for key, group in data.groupby(group_columns, sort=True, observed=True):
+        if not isinstance(key, tuple):
+            key = (key,)
+        series[key] = to_daily(group[['Date', target]])[target]
+    return series
+
+
+def _forecast_series(y, target, forecast_days, train_fraction, order, seasonal_order, fallback=None):
+    """Fit SARIMAX to one series; with a fallback model, a failed fit is replaced by the fast model."""
+    train_size = int(train_fraction * len(y))
+    start = y.index[train_size - 1] + pd.Timedelta(days=1)
+    dates = pd.date_range(start, periods=forecast_days, freq='D')
+    try:
+        # Batch runs cover thousands of groups; caching them would push the app's own fits out of the cache.
+        results = fit_sarimax(y, train_size, target, order, seasonal_order, use_cache=False)
+        return dates, results.get_forecast(steps=forecast_days).predicted_mean.to_numpy(), 'sarimax', None
+    except Exception as e:
+        if fallback is None:
+            raise
+        values = forecast_one(y.iloc[:train_size], forecast_days, fallback).to_numpy()
+        return dates, values, fallback, f"{type(e).__name__}: {e}"
+
+
+def _iter_fast_forecast(series, group_columns, columns, forecast_days, train_fraction, model):
+    """Forecast every series at once with a fast model, on one shared calendar."""
+    keys, dates, Y = to_matrix(series)
+    train_size = int(train_fraction * len(dates))
+    forecasts = forecast_matrix(Y[:, :train_size], forecast_days, model)
+    horizon = pd.date_range(dates[train_size - 1] + pd.Timedelta(days=1), periods=forecast_days, freq='D')
+    observed = ~np.isnan(Y[:, :train_size])
+    for key, values, seen in zip(keys, forecasts, observed):
+        labels = dict(zip(group_columns, key))
+        if not seen.any():
+            yield pd.DataFrame([{**labels, 'Model': model, 'Status': 'failed',
+                                 'Error': "no observations in the training window"}], columns=columns)
+            continue
+        frame = pd.DataFrame({'Date': horizon, 'Forecast': values})
+        yield frame.assign(**labels, Model=model, Status='ok', Error=None).reindex(columns=columns)
+
+
+def iter_batch_forecast(data, group_columns, target, forecast_days, workers=None, timeout=DEFAULT_TIMEOUT,
+                        train_fraction=1.0, order=ORDER, seasonal_order=SEASONAL_ORDER, model='sarimax',
+                        fallback=FALLBACK_MODEL):
+    """Forecast every group, yielding one tidy frame per group as it completes.
+
+    With model 'sarimax' each group is fitted in a process pool. A successful group yields
+    forecast_days rows with Status 'ok'. A group that raises or exceeds its timeout is
+    forecast with the fallback model and marked 'fallback', or, when fallback is None,
+    yields a single row with Status 'failed' or 'timeout'; either way the reason is in
+    Error, so one bad series never aborts the batch. The timeout counts from when a
+    worker starts the fit, and a fit that overruns is killed rather than left holding
+    its worker. Any other model forecasts every
+    group at once with the vectorized models in fast_models.
+    """
+    if isinstance(group_columns, str):
+        group_columns = [group_columns]
+    if model not in BATCH_MODELS:
+        raise ValueError(f"Unknown model: {model}. Choose from {', '.join(BATCH_MODELS)}")
+    series = split_series(data, group_columns, target)
+    columns = group_columns + ['Date', 'Forecast', 'Model', 'Status', 'Error']
+    if model != 'sarimax':
+        yield from _iter_fast_forecast(series, group_columns, columns, forecast_days, train_fraction, model)
+        return
+
+    workers = workers or os.cpu_count()
+    keys = list(series)
+    tasks = [(series[key], target, forecast_days, train_fraction, order, seasonal_order, fallback) for key in keys]
+    for index, result, failure in map_with_timeout(_forecast_series, tasks, workers, timeout):
+        key = keys[index]
+        labels = dict(zip(group_columns, key))
+        if isinstance(failure, TimeoutError):
+            if fallback is None:
+                yield pd.DataFrame([{**labels, 'Model': model, 'Status': 'timeout', 'Error': str(failure)}],
+                                   columns=columns)
+                continue
+            train_size = int(train_fraction * len(series[key]))
+            forecast_values = forecast_one(series[key].iloc[:train_size], forecast_days, fallback)
+            dates, values = forecast_values.index, forecast_values.to_numpy()
+            used, error = fallback, str(failure)
+        elif failure is not None:
+            yield pd.DataFrame([{**labels, 'Model': model, 'Status': 'failed',
+                                 'Error': f"{type(failure).__name__}: {failure}"}], columns=columns)
+            continue
+        else:
+            dates, values, used, error = result
+        frame = pd.DataFrame({'Date': dates, 'Forecast': values})
+        status = 'ok' if used == model else 'fallback'
+        yield frame.assign(**labels, Model=used, Status=status, Error=error).reindex(columns=columns)
+
+@timed('batch_forecast')
+def batch_forecast(data, group_columns, target, forecast_days, **kwargs):
+    """Forecast every group and return the results of iter_batch_forecast as one frame."""
+    frames = list(iter_batch_forecast(data, group_columns, target, forecast_days, **kwargs))
+    if not frames:
+        columns = ([group_columns] if isinstance(group_columns, str) else list(group_columns)) + ['Date', 'Forecast', 'Model', 'Status', 'Error']
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,182 @@
+"""Time every stage of the forecast flow on synthetic datasets of increasing size.
+
+For each size the suite writes a synthetic dataset in every requested format and times
+loading it (first upload, which converts xlsx/csv to the cached Parquet copy, and a repeat
+upload), then times the remaining stages once per size: missing-data cleaning, the
+duplicate-date aggregation and daily resample, the SARIMAX fit (model cache cleared
+first), get_forecast, simulating sample paths for a year of quantiles, the metrics and
+building and serializing the forecast and trend figures. Results are written as JSON; pass an earlier run to --compare to see the change
+per stage.
+
+    python benchmarks/stages.py --sizes 3x1 10x3 --formats csv parquet --output stages.json
+    python benchmarks/stages.py --sizes 3x1 10x3 --compare stages.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The app reads its cache location at import time, so point it somewhere disposable first.
+os.environ.setdefault("FLAVOUR_CACHE_DIR", tempfile.mkdtemp(prefix="flavour-bench-"))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from chart_rendering import build_figure
+from model_cache import CACHE_DIR, get_model_cache
+from pipeline import TARGETS, TRAIN_FRACTION, clean_missing, evaluate_forecast, fit_sarimax, load, to_daily
+from probabilistic import probabilistic_forecast
+from synthetic import FORMATS, generate, write
+
+FORECAST_DAYS = 30
+PROBABILISTIC_DAYS = 365
+
+
+def _summarise(samples):
+    return {"median": statistics.median(samples), "min": min(samples), "max": max(samples), "samples": samples}
+
+
+def _measure(function, repeat, setup=None):
+    """Run function `repeat` times, calling setup untimed before each run; returns (last result, timings)."""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - start)
+    return result, _summarise(samples)
+
+
+def _clear_datasets():
+    shutil.rmtree(os.path.join(CACHE_DIR, "datasets"), ignore_errors=True)
+
+
+def _forecast_figure(forecast_values):
+    # Same trace as the Forecast page, serialized the way Streamlit ships it to the browser.
+    fig = go.Figure(go.Scatter(y=forecast_values, mode='lines', name='Forecasted Demand',
+                               text=[f"<b>{val:.2f}</b>" for val in forecast_values], hoverinfo='text'))
+    return fig.to_json()
+
+
+def time_loading(path, repeat):
+    stages = {}
+    _, stages["load_first"] = _measure(lambda: load(path), repeat, setup=_clear_datasets)
+    data, stages["load_repeat"] = _measure(lambda: load(path), repeat)
+    return data, stages
+
+
+def time_pipeline(data, repeat, target=TARGETS[0]):
+    stages = {}
+    data, stages["clean_missing"] = _measure(lambda: clean_missing(data), repeat)
+    daily, stages["daily_resample"] = _measure(lambda: to_daily(data), repeat)
+
+    y = daily[target]
+    train_size = int(TRAIN_FRACTION * len(y))
+    results, stages["sarimax_fit"] = _measure(lambda: fit_sarimax(y, train_size, target), repeat,
+                                              setup=get_model_cache().clear)
+    forecast_values, stages["get_forecast"] = _measure(
+        lambda: results.get_forecast(steps=FORECAST_DAYS).predicted_mean, repeat)
+    _, stages["simulate_paths"] = _measure(lambda: probabilistic_forecast(results, PROBABILISTIC_DAYS), repeat)
+    test_data = y[train_size:]
+    _, stages["metrics"] = _measure(lambda: evaluate_forecast(results.get_forecast(steps=len(test_data)).predicted_mean,
+                                                              test_data), repeat)
+    _, stages["forecast_figure"] = _measure(lambda: _forecast_figure(forecast_values), repeat)
+    _, stages["trend_figure"] = _measure(
+        lambda: build_figure("Line Chart", data, "Date", target).to_json(), repeat)
+    return stages
+
+
+def _revision():
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return output.stdout.strip() or None
+
+
+def run(sizes, formats, regions, repeat, directory):
+    results = {
+        "revision": _revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "versions": {module.__name__: module.__version__ for module in (np, pd)},
+        "repeat": repeat,
+        "datasets": [],
+    }
+    for flavours, years in sizes:
+        data = generate(flavours, years, regions)
+        loaded = None
+        for extension in formats:
+            path = write(data, os.path.join(directory, f"sales_{flavours}x{years}.{extension}"))
+            loaded, stages = time_loading(path, repeat)
+            results["datasets"].append({"flavours": flavours, "years": years, "regions": regions, "rows": len(data),
+                                        "format": extension, "bytes": os.path.getsize(path), "stages": stages})
+        pipeline_stages = time_pipeline(loaded, repeat)
+        for dataset in results["datasets"][-len(formats):]:
+            dataset["stages"].update(pipeline_stages)
+    return results
+
+
+def _key(dataset):
+    return dataset["flavours"], dataset["years"], dataset["regions"], dataset["format"]
+
+
+def compare(results, baseline):
+    """Print the median time of every stage next to the baseline's and their ratio."""
+    previous = {_key(dataset): dataset["stages"] for dataset in baseline["datasets"]}
+    print(f"compared with {baseline.get('revision') or 'baseline'}")
+    for dataset in results["datasets"]:
+        old = previous.get(_key(dataset))
+        if old is None:
+            continue
+        label = "{flavours}x{years}x{regions} {format}".format(**dataset)
+        for stage, timing in dataset["stages"].items():
+            if stage in old:
+                before, after = old[stage]["median"], timing["median"]
+                ratio = after / before if before else float("nan")
+                print(f"{label:20} {stage:16} {before * 1000:9.1f} ms -> {after * 1000:9.1f} ms  x{ratio:.2f}")
+
+
+def _size(text):
+    flavours, _, years = text.partition("x")
+    return int(flavours), float(years) if "." in years else int(years)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=_size, default=[(3, 1), (10, 3)], metavar="FLAVOURSxYEARS",
+                        help="Dataset sizes to generate, e.g. 3x1 10x3")
+    parser.add_argument("--regions", type=int, default=3, help="Rows per flavour and date (duplicate dates)")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=["csv", "parquet"])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier JSON output to compare against")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="flavour-data-") as directory:
+        results = run(args.sizes, args.formats, args.regions, args.repeat, directory)
+
+    for dataset in results["datasets"]:
+        label = "{flavours}x{years}x{regions} {format}".format(**dataset)
+        for stage, timing in dataset["stages"].items():
+            print(f"{label:20} {stage:16} {timing['median'] * 1000:9.1f} ms")
+    if args.compare:
+        with open(args.compare) as handle:
+            compare(results, json.load(handle))
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure cold-start cost of the app: import time per section and first render of the entry pages.
+
+Every measurement runs in a fresh interpreter so nothing is shared through sys.modules.
+
+    python benchmarks/startup.py --repeat 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["streamlit", "data_preview", "trend_analysis", "forecasting", "model_accuracy", "pipeline", "cli"]
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+# Renders app.py through Streamlit's test harness: once logged out and once on the Home page.
+RENDER_SNIPPET = """
+import time
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+app = AppTest.from_file("app.py", default_timeout=60)
+{setup}
+app.run()
+assert not app.exception, [e.value for e in app.exception]
+print(time.perf_counter() - start)
+"""
+
+PAGES = {
+    "login": "",
+    "home": "app.session_state['logged_in'] = True",
+}
+
+
+def _time(snippet):
+    output = subprocess.run([sys.executable, "-c", snippet], cwd=ROOT, check=True, capture_output=True, text=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def _summarise(samples):
+    return {"median": statistics.median(samples), "min": min(samples), "max": max(samples), "samples": samples}
+
+
+def run(repeat):
+    results = {"python": sys.version.split()[0], "imports": {}, "render": {}}
+    for module in MODULES:
+        results["imports"][module] = _summarise([_time(IMPORT_SNIPPET.format(module=module)) for _ in range(repeat)])
+    for page, setup in PAGES.items():
+        results["render"][page] = _summarise([_time(RENDER_SNIPPET.format(setup=setup)) for _ in range(repeat)])
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per measurement")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    for section in ("imports", "render"):
+        for name, timing in results[section].items():
+            print(f"{section:8} {name:16} {timing['median'] * 1000:8.1f} ms")
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
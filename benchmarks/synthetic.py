@@ -0,0 +1,110 @@
+"""Generate synthetic potato-chip sales data shaped like the uploads the app expects.
+
+Every flavour is sold in every region every day, so each date appears flavours x regions
+times, and a share of the values is blanked out for the missing-data step to fill.
+
+    python benchmarks/synthetic.py --flavours 8 --years 3 --regions 4 --output sales.parquet
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+FLAVOURS = ["Classic Salted", "Salt & Vinegar", "Sour Cream & Onion", "Barbecue", "Cheese & Onion",
+            "Sweet Chilli", "Jalapeno", "Paprika", "Truffle", "Honey Mustard"]
+REGIONS = ["North", "South", "East", "West", "Central"]
+PROMOTIONS = ["None", "Discount", "BOGO", "Others"]
+PROMOTION_WEIGHTS = [0.7, 0.15, 0.1, 0.05]
+PROMOTION_LIFT = {"None": 1.0, "Discount": 1.15, "BOGO": 1.3, "Others": 1.05}
+
+# Columns left complete because every page needs them intact.
+KEY_COLUMNS = ["Date", "Flavour", "Region"]
+
+FORMATS = ["xlsx", "csv", "parquet"]
+
+
+def _flavour_names(n):
+    return [FLAVOURS[i] if i < len(FLAVOURS) else f"Flavour {i + 1}" for i in range(n)]
+
+
+def generate(flavours=5, years=2, regions=3, missing_fraction=0.01, start="2021-01-01", seed=0):
+    """One row per date, flavour and region with weekly and yearly seasonality, trend,
+    promotions, weather and macro indicators."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=int(round(365.25 * years)), freq="D")
+    names = _flavour_names(flavours)
+    region_names = REGIONS[:regions] + [f"Region {i + 1}" for i in range(len(REGIONS), regions)]
+
+    n_days = len(dates)
+    day = np.arange(n_days)
+    # Shared daily drivers: the weather and economy are the same for every flavour and region.
+    temperature = 18 + 9 * np.sin(2 * np.pi * (day - 100) / 365.25) + rng.normal(0, 2.5, n_days)
+    humidity = np.clip(60 - 0.8 * (temperature - 18) + rng.normal(0, 6, n_days), 15, 100)
+    cpi = 100 * 1.03 ** (day / 365.25) + rng.normal(0, 0.2, n_days)
+    economy = np.cumsum(rng.normal(0, 0.05, n_days)) + 100
+    income = 40000 + 15 * day + rng.normal(0, 200, n_days)
+    weekly = 1 + 0.25 * np.isin(dates.dayofweek, [4, 5]) - 0.1 * (dates.dayofweek == 0)
+    yearly = 1 + 0.15 * np.sin(2 * np.pi * (day - 100) / 365.25)
+
+    series = len(names) * len(region_names)
+    base = rng.uniform(50, 400, series)[:, None]
+    growth = 1 + rng.normal(0.05, 0.05, series)[:, None] * day / 365.25
+    promotion = rng.choice(PROMOTIONS, size=(series, n_days), p=PROMOTION_WEIGHTS)
+    lift = pd.Series(PROMOTION_LIFT).reindex(promotion.ravel()).to_numpy().reshape(series, n_days)
+    demand = base * growth * weekly * yearly * lift * (1 + 0.01 * (temperature - 18)) * rng.lognormal(0, 0.08, (series, n_days))
+    sales = demand * rng.uniform(0.85, 1.0, (series, n_days))
+    production = demand * rng.uniform(1.0, 1.2, (series, n_days))
+
+    data = pd.DataFrame({
+        "Date": np.tile(dates, series),
+        "Flavour": np.repeat(names, len(region_names) * n_days),
+        "Region": np.tile(np.repeat(region_names, n_days), len(names)),
+        "Promotion Type": promotion.ravel(),
+        "Sales Volume": sales.ravel().round(),
+        "Demand Volume": demand.ravel().round(),
+        "Production Volume": production.ravel().round(),
+        "Remaining Volume": (production - sales).ravel().round(),
+        "Temperature": np.tile(temperature, series).round(1),
+        "Humidity": np.tile(humidity, series).round(1),
+        "Consumer Price Index": np.tile(cpi, series).round(2),
+        "Economic Indicator": np.tile(economy, series).round(2),
+        "Disposable Income Level": np.tile(income, series).round(),
+    })
+
+    if missing_fraction:
+        for column in data.columns.difference(KEY_COLUMNS):
+            data.loc[rng.random(len(data)) < missing_fraction, column] = np.nan
+    # Uploads are rarely sorted by date.
+    return data.sort_values(["Flavour", "Region", "Date"], ignore_index=True)
+
+
+def write(data, path):
+    """Write the data as xlsx, csv or parquet depending on the extension of path."""
+    if path.endswith(".xlsx"):
+        data.to_excel(path, index=False)
+    elif path.endswith(".csv"):
+        data.to_csv(path, index=False)
+    elif path.endswith(".parquet"):
+        data.to_parquet(path, index=False)
+    else:
+        raise ValueError(f"Unsupported output format: {path}. Use one of {', '.join(FORMATS)}")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flavours", type=int, default=5)
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--regions", type=int, default=3, help="Rows per flavour and date, i.e. duplicate dates")
+    parser.add_argument("--missing", type=float, default=0.01, help="Share of values left empty")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="Destination .xlsx, .csv or .parquet file")
+    args = parser.parse_args(argv)
+
+    data = generate(args.flavours, args.years, args.regions, args.missing, seed=args.seed)
+    write(data, args.output)
+    print(f"Wrote {len(data):,} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Roughly one point per horizontal pixel of a wide chart; more than this is invisible detail.
+PIXEL_BUDGET = 1500
+# Above this many source rows line and scatter traces are drawn with WebGL instead of SVG.
+WEBGL_THRESHOLD = 5000
+# Per-point text labels are only drawn when there are few enough points to read them.
+TEXT_LABEL_LIMIT = 200
+# Box and pie charts stop being readable long before they stop being renderable.
+MAX_BOXES = 100
+MAX_SLICES = 50
+
+
+def _numeric(values):
+    """Float view of numeric or datetime values, or None when the values are not ordered numbers."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype='datetime64[ns]').astype('int64').astype('float64')
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.to_numpy(dtype='float64')
+    return None
+
+
+def minmax_indices(y, n_buckets):
+    """Indices of the minimum and maximum of y in each of n_buckets equal-width buckets, in order."""
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+    buckets = np.arange(n) * n_buckets // n
+    # Sorting by (bucket, y) puts each bucket's minimum first and its maximum last.
+    order = np.lexsort((y, buckets))
+    starts = np.searchsorted(buckets[order], np.arange(n_buckets))
+    ends = np.append(starts[1:], n) - 1
+    return np.unique(np.concatenate([order[starts], order[ends]]))
+
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling; returns the indices of the points to keep."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x, next_y = x[end:edges[i + 2]].mean(), y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def downsample_line(data, x_axis, y_axis, budget=PIXEL_BUDGET):
+    """Reduce a line chart to about `budget` points that keep its visual shape."""
+    data = data[[x_axis, y_axis]].dropna()
+    if len(data) <= budget:
+        return data
+    x = _numeric(data[x_axis])
+    if x is None:
+        x = np.arange(len(data), dtype='float64')
+    else:
+        order = np.argsort(x, kind='stable')
+        data, x = data.iloc[order], x[order]
+    y = _numeric(data[y_axis])
+    if y is None:
+        return data.iloc[np.linspace(0, len(data) - 1, budget).astype(np.int64)]
+
+    # Very long series are first cut down with min/max buckets, which is linear and keeps
+    # every peak, so the LTTB pass only sees a few points per output pixel.
+    keep = minmax_indices(y, 2 * budget)
+    chosen = keep[lttb(x[keep], y[keep], budget)]
+    return data.iloc[chosen]
+
+
+def density_bins(data, x_axis, y_axis, budget=PIXEL_BUDGET):
+    """2-D histogram of two numeric columns as (x_centers, y_centers, counts), or None."""
+    x, y = _numeric(data[x_axis]), _numeric(data[y_axis])
+    if x is None or y is None:
+        return None
+    valid = ~(np.isnan(x) | np.isnan(y))
+    bins = max(int(np.sqrt(budget * 4)), 10)
+    counts, x_edges, y_edges = np.histogram2d(x[valid], y[valid], bins=bins)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    if pd.api.types.is_datetime64_any_dtype(data[x_axis]):
+        x_centers = pd.to_datetime(x_centers.astype('int64'))
+    counts = np.where(counts > 0, counts, np.nan)
+    return x_centers, y_centers, counts.T
+
+
+def _total(data, x_axis, y_axis):
+    """Sum of y per x value; rows are counted instead when y cannot be summed."""
+    how = 'sum' if pd.api.types.is_numeric_dtype(data[y_axis]) else 'count'
+    return data.groupby(x_axis, observed=True, sort=True)[y_axis].agg(how)
+
+
+def aggregate(data, x_axis, y_axis, budget=PIXEL_BUDGET):
+    """Total y per x value, merging neighbouring x values into buckets when there are too many to draw."""
+    grouped = _total(data, x_axis, y_axis)
+    if len(grouped) > budget and _numeric(grouped.index.to_series()) is not None:
+        buckets = np.arange(len(grouped)) * budget // len(grouped)
+        grouped = grouped.groupby(buckets).agg('sum').set_axis(grouped.index[np.searchsorted(buckets, np.arange(budget))])
+    return grouped
+
+
+def top_slices(data, x_axis, y_axis):
+    """Total y per x value, keeping the MAX_SLICES largest and folding the rest into 'Other'."""
+    totals = _total(data, x_axis, y_axis)
+    if len(totals) <= MAX_SLICES:
+        return totals
+    totals = totals.sort_values(ascending=False)
+    largest = totals.iloc[:MAX_SLICES - 1]
+    largest.index = largest.index.astype(str)
+    return pd.concat([largest, pd.Series({'Other': totals.iloc[MAX_SLICES - 1:].sum()})])
+
+
+def box_statistics(data, x_axis, y_axis):
+    """Quartiles and Tukey fences of y per x value, so the browser never receives the raw points.
+
+    A numeric x with more than MAX_BOXES distinct values is cut into MAX_BOXES intervals.
+    """
+    x = data[x_axis]
+    if _numeric(x) is not None and x.nunique() > MAX_BOXES:
+        bins = pd.cut(x, MAX_BOXES)
+        x = bins.map(lambda interval: interval.mid).astype(x.dtype if not pd.api.types.is_integer_dtype(x) else 'float64')
+    grouped = data[y_axis].groupby(x, observed=True, sort=True)
+    stats = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ['q1', 'median', 'q3']
+    iqr = stats['q3'] - stats['q1']
+    stats['lowerfence'] = np.maximum(stats['q1'] - 1.5 * iqr, grouped.min())
+    stats['upperfence'] = np.minimum(stats['q3'] + 1.5 * iqr, grouped.max())
+    return stats
+
+
+def _scatter_trace(x, y, mode, rows, **kwargs):
+    trace = go.Scattergl if rows > WEBGL_THRESHOLD else go.Scatter
+    return trace(x=x, y=y, mode=mode, **kwargs)
+
+
+def build_figure(visualization_type, data, x_axis, y_axis, budget=PIXEL_BUDGET):
+    """Build the chart for the Analyze Data page with a payload bounded by `budget`, whatever the row count."""
+    if visualization_type == "Bar Chart":
+        totals = aggregate(data, x_axis, y_axis, budget)
+        fig = go.Figure(go.Bar(x=totals.index, y=totals.to_numpy()))
+        fig.update_layout(title=f"{y_axis} vs {x_axis} - Bar Chart")
+        if len(totals) <= TEXT_LABEL_LIMIT:
+            fig.update_traces(textposition="inside", texttemplate="%{y}")
+
+    elif visualization_type == "Line Chart":
+        points = downsample_line(data, x_axis, y_axis, budget)
+        fig = go.Figure(_scatter_trace(points[x_axis].to_numpy(), points[y_axis].to_numpy(), 'lines', len(data)))
+        fig.update_layout(title=f"{y_axis} vs {x_axis} - Line Chart")
+
+    elif visualization_type == "Pie Chart":
+        totals = top_slices(data, x_axis, y_axis)
+        fig = go.Figure(go.Pie(labels=totals.index, values=totals.to_numpy(), hole=0.3))  # Optional: Donut hole
+        fig.update_layout(title=f"{y_axis} Distribution - Pie Chart")
+        fig.update_traces(textinfo="label+percent", insidetextorientation="radial")
+
+    elif visualization_type == "Heatmap":
+        correlation_matrix = data[[x_axis, y_axis]].corr()
+        fig = go.Figure(go.Heatmap(z=correlation_matrix.to_numpy(), x=correlation_matrix.columns,
+                                   y=correlation_matrix.index, texttemplate="%{z}"))
+        fig.update_layout(title=f"Correlation Heatmap: {x_axis} and {y_axis}")
+
+        # Making inside heatmap values **bold**
+        fig.update_traces(
+            textfont=dict(size=16, color="white", family="Arial white")  # Bold white values inside heatmap
+        )
+
+    elif visualization_type == "Boxplot":
+        stats = box_statistics(data, x_axis, y_axis)
+        fig = go.Figure(go.Box(x=stats.index, q1=stats['q1'], median=stats['median'], q3=stats['q3'],
+                               lowerfence=stats['lowerfence'], upperfence=stats['upperfence']))
+        fig.update_layout(title=f"{y_axis} by {x_axis} - Boxplot")
+
+    elif visualization_type == "Scatterplot":
+        binned = density_bins(data, x_axis, y_axis, budget) if len(data) > budget else None
+        if binned is not None:
+            x_centers, y_centers, counts = binned
+            fig = go.Figure(go.Heatmap(x=x_centers, y=y_centers, z=counts, colorscale="Viridis",
+                                       colorbar=dict(title="Rows"), hovertemplate="%{x}: %{y}<br>%{z} rows"))
+            fig.update_layout(title=f"{y_axis} vs {x_axis} - Scatterplot (density of {len(data):,} rows)")
+        else:
+            points = data if len(data) <= budget else data.sample(budget, random_state=0)
+            y = points[y_axis].to_numpy()
+            if len(points) <= TEXT_LABEL_LIMIT:
+                trace = _scatter_trace(points[x_axis].to_numpy(), y, "markers+text", len(data), textposition="top center", text=y)
+            else:
+                trace = _scatter_trace(points[x_axis].to_numpy(), y, "markers", len(data))
+            fig = go.Figure(trace)
+            fig.update_layout(title=f"{y_axis} vs {x_axis} - Scatterplot")
+
+    else:
+        raise ValueError(f"Unknown visualization type: {visualization_type}")
+
+    # Update layout for hover interaction
+    fig.update_traces(hovertemplate="%{x}: %{y}", selector=lambda trace: trace.hovertemplate is None)
+    fig.update_layout(xaxis_title=x_axis, yaxis_title=y_axis)
+    return fig
@@ -0,0 +1,249 @@
+"""Time-aware cleaning: every series gets one row per day and its gaps are imputed in time order.
+
+A series is one combination of the series columns (flavour, region, ...). Rows are sorted
+once by series and date, then processed a chunk of whole series at a time, so the working
+memory is bounded by CHUNK_ROWS rather than the size of the upload. Within a chunk all
+series are handled together with array operations: duplicate dates are merged, missing
+days inserted and every column filled from its neighbours in time within its own series.
+"""
+import numpy as np
+import pandas as pd
+
+# Volume columns (those summed per day) are filled with one of these methods; other
+# numeric columns are always interpolated and text/categorical columns carried forward.
+METHODS = {
+    'interpolate': "Linear interpolation between the surrounding days",
+    'seasonal': "Same weekday of the nearest observed week",
+    'zero': "Zero (no sales on missing days)",
+}
+SEASON = 7
+CHUNK_ROWS = 1_000_000
+SERIES_WORDS = ("flavour", "flavor", "region", "store")
+
+REPORT_COLUMNS = ['First Date', 'Last Date', 'Days', 'Missing Days', 'Gaps', 'Longest Gap', 'Duplicate Rows',
+                  'Filled Values']
+
+
+def series_columns(data):
+    """Columns that identify a series by default: flavour, region and store columns."""
+    return [column for column in data.columns
+            if any(word in str(column).lower() for word in SERIES_WORDS)
+            and not pd.api.types.is_float_dtype(data[column])]
+
+
+def _bounds(keys):
+    """First and last position of each row's run of equal keys."""
+    n = len(keys)
+    positions = np.arange(n)
+    changes = keys[1:] != keys[:-1]
+    starts = np.maximum.accumulate(np.where(np.r_[True, changes], positions, 0))
+    ends = np.minimum.accumulate(np.where(np.r_[changes, True], positions, n)[::-1])[::-1]
+    return starts, ends
+
+
+def _neighbours(valid, starts, ends):
+    """Nearest valid position at or before / at or after each row within its run; -1 / n when there is none."""
+    n = len(valid)
+    positions = np.arange(n)
+    previous = np.maximum.accumulate(np.where(valid, positions, -1))
+    following = np.minimum.accumulate(np.where(valid, positions, n)[::-1])[::-1]
+    return np.where(previous >= starts, previous, -1), np.where(following <= ends, following, n)
+
+
+def _interpolate(values, starts, ends):
+    """Linear interpolation inside each run, carrying the nearest value out to its edges."""
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+    n = len(values)
+    previous, following = _neighbours(~missing, starts, ends)
+    has_previous, has_following = previous >= 0, following < n
+    filled = values.copy()
+
+    both = missing & has_previous & has_following
+    p, q, i = previous[both], following[both], np.flatnonzero(both)
+    filled[both] = values[p] + (values[q] - values[p]) * (i - p) / (q - p)
+    only_previous = missing & has_previous & ~has_following
+    filled[only_previous] = values[previous[only_previous]]
+    only_following = missing & ~has_previous & has_following
+    filled[only_following] = values[following[only_following]]
+    return filled
+
+
+def _carry(valid, starts, ends):
+    """Position to copy each row from: itself if valid, else the previous, else the next valid row; -1 if none."""
+    previous, following = _neighbours(valid, starts, ends)
+    source = np.where(previous >= 0, previous, np.where(following < len(valid), following, -1))
+    return np.where(valid, np.arange(len(valid)), source)
+
+
+def _seasonal(values, series, phase, starts, ends):
+    """Fill from the same weekday of the nearest observed week, interpolating whatever is left."""
+    # lexsort is stable, so rows stay in date order within each (series, weekday) run.
+    order = np.lexsort((phase, series))
+    permuted = values[order]
+    valid = ~np.isnan(permuted)
+    source = _carry(valid, *_bounds(series[order] * SEASON + phase[order]))
+    filled = np.full_like(values, np.nan)
+    filled[order] = np.where(source >= 0, permuted[np.maximum(source, 0)], np.nan)
+    return _interpolate(filled, starts, ends)
+
+
+def _merge_duplicates(chunk, series, days, sums):
+    """One row per series and day: volumes summed, other numbers averaged, the rest take the first value."""
+    keys = [pd.Series(series, name='_series'), pd.Series(days, name='_day')]
+    grouped = chunk.reset_index(drop=True).groupby(keys, sort=True)
+    numeric = [column for column in chunk.columns if pd.api.types.is_numeric_dtype(chunk[column])
+               and not pd.api.types.is_bool_dtype(chunk[column])]
+    summed = [column for column in numeric if column in sums]
+    averaged = [column for column in numeric if column not in sums]
+    rest = [column for column in chunk.columns if column not in numeric]
+    parts = [grouped[summed].sum(min_count=1), grouped[averaged].mean(), grouped[rest].first()]
+    merged = pd.concat([part for part in parts if part.shape[1]], axis=1)[chunk.columns]
+    index = merged.index
+    return merged.reset_index(drop=True), index.get_level_values(0).to_numpy(), index.get_level_values(1).to_numpy()
+
+
+def _clean_chunk(chunk, series, days, key_columns, method, sums, fallbacks):
+    """Clean a chunk of whole series, rows sorted by series and day. Returns (cleaned, per-series stats)."""
+    ids, first_rows = np.unique(series, return_index=True)
+    duplicates = np.zeros(len(ids), dtype=np.int64)
+    is_duplicate = np.r_[False, (series[1:] == series[:-1]) & (days[1:] == days[:-1])]
+    if is_duplicate.any():
+        duplicates = np.bincount(np.searchsorted(ids, series[is_duplicate]), minlength=len(ids))
+        chunk, series, days = _merge_duplicates(chunk, series, days, sums)
+        first_rows = np.searchsorted(series, ids)
+    else:
+        chunk = chunk.reset_index(drop=True)
+
+    # Full daily calendar of every series, from its own first to its own last day.
+    observed = np.diff(np.r_[first_rows, len(series)])
+    first_day = days[first_rows]
+    last_day = days[np.r_[first_rows[1:], len(series)] - 1]
+    lengths = last_day - first_day + 1
+    offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+    total = int(lengths.sum())
+    full_series = np.repeat(ids, lengths)
+    full_days = np.repeat(first_day, lengths) + np.arange(total) - np.repeat(offsets, lengths)
+    positions = np.repeat(offsets, observed) + days - np.repeat(first_day, observed)
+    starts = np.repeat(offsets, lengths)
+    ends = starts + np.repeat(lengths, lengths) - 1
+    phase = (full_days - np.repeat(first_day, lengths)) % SEASON
+
+    gaps = np.diff(days)
+    same_series = series[1:] == series[:-1]
+    gap_sizes = np.where(same_series & (gaps > 1), gaps - 1, 0)
+    series_of_gap = np.searchsorted(ids, series[1:])
+    gap_counts = np.bincount(series_of_gap, weights=gap_sizes > 0, minlength=len(ids)).astype(np.int64)
+    longest = np.zeros(len(ids), dtype=np.int64)
+    np.maximum.at(longest, series_of_gap, gap_sizes)
+
+    filled_values = np.zeros(len(ids), dtype=np.int64)
+    series_of_row = np.repeat(np.arange(len(ids)), lengths)
+    columns = {}
+    for column in chunk.columns:
+        source = chunk[column]
+        if column in key_columns:
+            columns[column] = source.take(np.repeat(first_rows, lengths)).reset_index(drop=True)
+            continue
+        if column == 'Date':
+            columns[column] = pd.Series(full_days.astype('datetime64[D]').astype('datetime64[ns]'))
+            continue
+
+        if pd.api.types.is_numeric_dtype(source) and not pd.api.types.is_bool_dtype(source):
+            values = np.full(total, np.nan)
+            values[positions] = source.to_numpy(dtype='float64', na_value=np.nan)
+            missing = np.isnan(values)
+            if column in sums and method == 'zero':
+                values = np.where(missing, 0.0, values)
+            elif column in sums and method == 'seasonal':
+                values = _seasonal(values, full_series, phase, starts, ends)
+            else:
+                values = _interpolate(values, starts, ends)
+            values = np.where(np.isnan(values), fallbacks.get(column, np.nan), values)
+            dtype = source.dtype if pd.api.types.is_float_dtype(source) else 'float64'
+            filled = pd.Series(values.astype(dtype))
+        else:
+            valid = np.zeros(total, dtype=bool)
+            valid[positions] = source.notna().to_numpy()
+            rows = np.full(total, -1)
+            rows[positions] = np.arange(len(source))
+            take = _carry(valid, starts, ends)
+            missing = ~valid
+            filled = source.take(np.maximum(rows[np.maximum(take, 0)], 0)).reset_index(drop=True)
+            filled = filled.where(take >= 0, fallbacks.get(column))
+        filled_values += np.bincount(series_of_row, weights=missing, minlength=len(ids)).astype(np.int64)
+        columns[column] = filled
+
+    cleaned = pd.DataFrame(columns)[list(chunk.columns)]
+    stats = {
+        '_series': ids,
+        'First Date': first_day.astype('datetime64[D]').astype('datetime64[ns]'),
+        'Last Date': last_day.astype('datetime64[D]').astype('datetime64[ns]'),
+        'Days': lengths,
+        'Missing Days': lengths - observed,
+        'Gaps': gap_counts,
+        'Longest Gap': longest,
+        'Duplicate Rows': duplicates,
+        'Filled Values': filled_values,
+    }
+    return cleaned, pd.DataFrame(stats)
+
+
+def clean_timeseries(data, group_columns=None, method='interpolate', sums=(), chunk_rows=CHUNK_ROWS):
+    """Clean an upload series by series; returns (cleaned, gap report).
+
+    group_columns identify a series (default: series_columns(data)); sums are the volume
+    columns that are summed per day and filled with `method`, one of METHODS. Rows without
+    a date are dropped. The cleaned frame is sorted by series and date; the gap report
+    has one row per series.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method: {method}. Choose from {', '.join(METHODS)}")
+    group_columns = list(series_columns(data) if group_columns is None else group_columns)
+    dates = pd.to_datetime(data['Date'])
+    dated = dates.notna().to_numpy()
+    if not dated.all():
+        data, dates = data[dated], dates[dated]
+    days = dates.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+    if group_columns:
+        series = data.groupby(group_columns, sort=True, observed=True, dropna=False).ngroup().to_numpy()
+    else:
+        series = np.zeros(len(data), dtype=np.int64)
+
+    # Whole-upload fallbacks for series where a column was never observed.
+    fallbacks = {}
+    for column in data.columns.difference(group_columns + ['Date']):
+        if pd.api.types.is_numeric_dtype(data[column]) and not pd.api.types.is_bool_dtype(data[column]):
+            fallbacks[column] = 0.0 if column in sums and method == 'zero' else data[column].mean()
+        else:
+            modes = data[column].mode()
+            fallbacks[column] = modes.iloc[0] if not modes.empty else None
+
+    order = np.lexsort((days, series))
+    series, days = series[order], days[order]
+    # Chunks end on series boundaries, so every series is cleaned in one piece.
+    series_starts = np.flatnonzero(np.r_[True, series[1:] != series[:-1]])
+    boundaries = [0]
+    for start in series_starts[1:]:
+        if start - boundaries[-1] >= chunk_rows:
+            boundaries.append(start)
+    boundaries.append(len(series))
+
+    if not len(series):
+        return data, pd.DataFrame(columns=group_columns + REPORT_COLUMNS)
+    cleaned, reports = [], []
+    for lo, hi in zip(boundaries[:-1], boundaries[1:]):
+        chunk = data.iloc[order[lo:hi]]
+        part, stats = _clean_chunk(chunk, series[lo:hi], days[lo:hi], group_columns, method, set(sums), fallbacks)
+        cleaned.append(part)
+        reports.append(stats)
+
+    cleaned = pd.concat(cleaned, ignore_index=True)
+    report = pd.concat(reports, ignore_index=True)
+    if group_columns:
+        keys = data.iloc[order[series_starts]][group_columns].reset_index(drop=True)
+        report = pd.concat([keys, report.drop(columns='_series')], axis=1)
+    else:
+        report = report.drop(columns='_series')
+    return cleaned, report
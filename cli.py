@@ -0,0 +1,222 @@
+"""Run the forecasting pipeline on a dataset without Streamlit.
+
+Examples:
+    python cli.py sales.xlsx --target "Sales Volume" --days 30 --output forecast.csv
+    python cli.py sales.parquet --group-by Flavour Region --workers 16 --output forecasts.parquet
+    python cli.py sales.parquet --group-by Flavour Store --model ets --output forecasts.parquet
+    python cli.py sales.xlsx --store --output /dev/null
+    python cli.py sales.xlsx --days 365 --quantiles --holidays 8 --output production_targets.csv
+
+Exit codes: 0 when every series was forecast, 1 when the dataset could not be loaded or
+forecast, 2 for invalid arguments and 3 when some groups in a batch failed. Series forecast
+with the fallback model count as forecast; they are reported on stderr.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import instrumentation
+from batch_forecasting import BATCH_MODELS, DEFAULT_TIMEOUT, iter_batch_forecast
+from cleaning import METHODS
+from forecast_store import get_forecast_store
+from order_search import CRITERIA, search_orders
+from probabilistic import PATHS, QUANTILES, UPLIFT_SPREAD, quantile_label
+from pipeline import (FALLBACK_MODEL, FIT_TIME_BUDGET, ORDER, PROMOTION_TYPES, SEASONAL_ORDER, TARGETS, TRAIN_FRACTION, adjust_forecast,
+                      clean_with_report, evaluate_forecast, forecast_quantiles, forecast_with_fallback, load, to_daily)
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_PARTIAL = 3
+
+QUANTILE_COLUMNS = [quantile_label(q) for q in QUANTILES] + [f"Cumulative {quantile_label(q)}" for q in QUANTILES]
+FLOAT_COLUMNS = ['Forecast', 'Adjusted Forecast'] + QUANTILE_COLUMNS
+
+
+class ResultWriter:
+    """Append result frames to a CSV or Parquet file as they are produced."""
+
+    def __init__(self, path):
+        self.path = path
+        self.format = 'parquet' if isinstance(path, str) and path.endswith('.parquet') else 'csv'
+        self._parquet = None
+        self._schema = None
+        self._header = True
+
+    def write(self, frame):
+        if self.format == 'csv':
+            frame.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+            self._header = False
+            return
+        if self._schema is None:
+            fields = [(column, pa.string()) for column in frame.columns if column not in ['Date'] + FLOAT_COLUMNS]
+            fields += [('Date', pa.timestamp('ns'))] + [(column, pa.float64()) for column in FLOAT_COLUMNS]
+            self._schema = pa.schema([field for field in fields if field[0] in frame.columns])
+            self._parquet = pq.ParquetWriter(self.path, self._schema)
+        frame = frame.astype({name: 'string' for name in self._schema.names if self._schema.field(name).type == pa.string()})
+        frame = frame.assign(Date=pd.to_datetime(frame['Date']))
+        self._parquet.write_table(pa.Table.from_pandas(frame[self._schema.names], schema=self._schema, preserve_index=False))
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Dataset to forecast (.xlsx, .csv, .parquet, .arrow or .feather)")
+    parser.add_argument("--target", choices=TARGETS, default=TARGETS[0], help="Column to forecast")
+    parser.add_argument("--days", type=int, default=30, help="Number of days to forecast")
+    parser.add_argument("--group-by", nargs="+", metavar="COLUMN", help="Forecast each combination of these columns separately")
+    parser.add_argument("--output", help="Write forecasts to this .csv or .parquet file (default: CSV on stdout)")
+    parser.add_argument("--clean", action="store_true",
+                        help="Fill calendar gaps and missing values per series (the --group-by columns, or "
+                             "flavour/region/store columns) before forecasting")
+    parser.add_argument("--clean-method", choices=list(METHODS), default='interpolate',
+                        help="How --clean fills missing volumes")
+    parser.add_argument("--gap-report", metavar="FILE", help="With --clean, write the per-series gap report to this CSV")
+    parser.add_argument("--train-fraction", type=float,
+                        help="Share of history used for fitting; the rest is the evaluation holdout (default: "
+                             f"{TRAIN_FRACTION}, or 1.0 with --group-by, where no holdout is evaluated)")
+    parser.add_argument("--auto-order", choices=CRITERIA,
+                        help="Search SARIMA orders by this criterion instead of using the defaults (single-series mode)")
+    parser.add_argument("--stepwise", action="store_true", help="Use stepwise instead of full grid order search")
+    parser.add_argument("--model", choices=BATCH_MODELS, default='sarimax',
+                        help="sarimax, or a fast vectorized model: snaive, ets or ma")
+    parser.add_argument("--time-budget", type=float, default=FIT_TIME_BUDGET,
+                        help="Seconds a single-series SARIMAX fit may take before the ets model answers instead; "
+                             "the fit still finishes and is cached before the command exits")
+    parser.add_argument("--no-fallback", action="store_true",
+                        help="Report failed or timed-out SARIMAX groups instead of forecasting them with ets")
+    parser.add_argument("--store", action="store_true",
+                        help="Also compute the SARIMAX forecast, its interval and backtest into the shared forecast "
+                             "store the app reads, e.g. from a job that runs when new data lands (single-series mode)")
+    parser.add_argument("--quantiles", action="store_true",
+                        help="Add daily and cumulative P10/P50/P90 columns from simulated sample paths, including the "
+                             "uncertainty of the holiday/concert/discount uplifts (single-series SARIMAX)")
+    parser.add_argument("--paths", type=int, default=PATHS, help="Sample paths for --quantiles")
+    parser.add_argument("--uplift-spread", type=float, default=UPLIFT_SPREAD,
+                        help="Relative standard deviation of each uplift for --quantiles (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes for batch forecasting")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds allowed per series in batch mode")
+    parser.add_argument("--stage-log", action="store_true", help="Log each stage's timing and memory as JSON on stderr")
+    parser.add_argument("--metrics", metavar="FILE", help="Write per-stage totals in the Prometheus text format on exit")
+    parser.add_argument("--holidays", type=int, default=0, help="Holidays in the forecast horizon")
+    parser.add_argument("--concerts", type=int, default=0, help="Concerts/festivals in the forecast horizon")
+    parser.add_argument("--promotion", choices=PROMOTION_TYPES, default="None", help="Promotion type")
+    parser.add_argument("--discount", type=float, default=0, help="Promotion discount in percent")
+    return parser
+
+
+def _adjust(frame, args):
+    adjusted, _, _ = adjust_forecast(frame['Forecast'], args.holidays, args.concerts, args.promotion, args.discount)
+    return frame.assign(**{'Adjusted Forecast': adjusted})
+
+
+def run_single(data, args, writer):
+    y = to_daily(data)[args.target]
+    order, seasonal_order = ORDER, SEASONAL_ORDER
+    if args.auto_order and args.model == 'sarimax':
+        train = y[:int(args.train_fraction * len(y))]
+        order, seasonal_order, _ = search_orders(train, args.target, args.auto_order, stepwise=args.stepwise, workers=args.workers)
+        print(json.dumps({'order': order, 'seasonal_order': seasonal_order}), file=sys.stderr)
+    if args.store and args.model == 'sarimax':
+        entry = get_forecast_store().refresh(os.path.basename(args.input), args.target, y, order=order,
+                                             seasonal_order=seasonal_order, train_fraction=args.train_fraction)
+        if entry is None or entry['status'] != 'ok':
+            print(f"Storing the forecast failed: {entry['error'] if entry else 'timed out waiting for another worker'}",
+                  file=sys.stderr)
+            return EXIT_ERROR
+        print(json.dumps({'stored_run': entry['id'], 'data_version': entry['data_version'][:12]}), file=sys.stderr)
+    forecast_values, test_data, used, reason = forecast_with_fallback(
+        y, args.target, args.days, args.train_fraction, order, seasonal_order, args.model, args.time_budget)
+    if reason:
+        print(json.dumps({'model': used, 'fallback_reason': reason}), file=sys.stderr)
+    frame = _adjust(pd.DataFrame({'Date': forecast_values.index, 'Forecast': forecast_values.to_numpy()}), args)
+    if args.quantiles and used == 'sarimax':
+        daily, cumulative = forecast_quantiles(y, args.target, args.days, args.train_fraction, order, seasonal_order,
+                                               args.holidays, args.concerts, args.promotion, args.discount,
+                                               args.uplift_spread, args.paths)
+        frame = frame.assign(**{column: daily[column].to_numpy() for column in daily.columns.drop('Mean')},
+                             **{f"Cumulative {column}": cumulative[column].to_numpy() for column in cumulative.columns.drop('Mean')})
+    elif args.quantiles:
+        print(json.dumps({'quantiles': f"skipped, they need SARIMAX and the forecast used {used}"}), file=sys.stderr)
+    writer.write(frame)
+    if not test_data.empty:
+        metrics = evaluate_forecast(forecast_values, test_data)
+        print(json.dumps({'target': args.target, 'holdout_days': len(test_data), **metrics}), file=sys.stderr)
+    return EXIT_OK
+
+
+def run_batch(data, args, writer):
+    failed = 0
+    for frame in iter_batch_forecast(data, args.group_by, args.target, args.days, workers=args.workers,
+                                     timeout=args.timeout, train_fraction=args.train_fraction, model=args.model,
+                                     fallback=None if args.no_fallback else FALLBACK_MODEL):
+        status = frame['Status'].iloc[0]
+        if status != 'ok':
+            failed += status != 'fallback'
+            print(json.dumps(frame.iloc[0][args.group_by + ['Model', 'Status', 'Error']].astype(str).to_dict()), file=sys.stderr)
+        writer.write(_adjust(frame, args))
+    return EXIT_PARTIAL if failed else EXIT_OK
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.train_fraction is None:
+        # Batch mode never scores a holdout, so its forecasts start after the last observed day.
+        args.train_fraction = 1.0 if args.group_by else TRAIN_FRACTION
+    if args.days < 1 or not 0 < args.train_fraction <= 1:
+        print("--days must be positive and --train-fraction in (0, 1]", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.stage_log:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        instrumentation.logger.addHandler(handler)
+        instrumentation.logger.setLevel(logging.INFO)
+    try:
+        return _run(args)
+    finally:
+        if args.metrics:
+            instrumentation.write_metrics(args.metrics)
+
+
+def _run(args):
+    try:
+        data = load(args.input)
+    except (OSError, ValueError) as e:
+        print(f"Could not load {args.input}: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    missing = [column for column in ['Date', args.target] + (args.group_by or []) if column not in data.columns]
+    if missing:
+        print(f"Missing columns in {args.input}: {', '.join(missing)}", file=sys.stderr)
+        return EXIT_ERROR
+    if args.clean:
+        data, report = clean_with_report(data, args.group_by, args.clean_method)
+        if report is not None:
+            totals = report[['Missing Days', 'Duplicate Rows', 'Filled Values']].sum().astype(int).to_dict()
+            print(json.dumps({'series': len(report), **totals}), file=sys.stderr)
+            if args.gap_report:
+                report.to_csv(args.gap_report, index=False)
+
+    writer = ResultWriter(args.output or sys.stdout)
+    try:
+        if args.group_by:
+            return run_batch(data, args, writer)
+        return run_single(data, args, writer)
+    except Exception as e:
+        print(f"Forecasting failed: {type(e).__name__}: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        writer.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,30 @@
 import streamlit as st
-import pandas as pd
+from cleaning import METHODS, series_columns
+from dataset_store import derived_key, get_dataset_store, source_key
+from ingest import SUPPORTED_TYPES, content_hash, dataset_columns
+from pipeline import analysis_columns, clean_with_report, load
 
-def handle_missing_data(data):
-    """Handle missing data by filling with appropriate methods."""
+def handle_missing_data(handle, group_columns=None, method='interpolate'):
+    """Handle missing data by filling calendar gaps and missing values series by series, in time order."""
     st.markdown("<h4 style='color: #FF7F50;'>Handling Missing Data</h4>", unsafe_allow_html=True)
     
-    # Fill missing values
-    for column in data.columns:
-        if data[column].dtype == "object":  # For categorical data, fill with mode
-            data[column].fillna(data[column].mode()[0], inplace=True)
-        else:  # For numerical data, fill with mean
-            data[column].fillna(data[column].mean(), inplace=True)
+    # Fill missing values; every session cleaning the same upload the same way shares the result
+    cleaned, report = clean_with_report(handle.data, group_columns, method)
+    key = derived_key(handle.key, f"clean_missing:{method}:{sorted(group_columns or [])}")
+    cleaned = get_dataset_store().put(cleaned, name=f"{handle.name} (cleaned)", key=key)
     
     # Confirm the missing data has been handled
     st.success("Missing data handled successfully!")
-    return data
+    return cleaned, report
+
+def gap_report_view(report):
+    """Summary and per-series table of the calendar gaps found while cleaning."""
+    st.markdown("<h4 style='color: #FF7F50;'>Gap Report</h4>", unsafe_allow_html=True)
+    series, missing, gaps = len(report), int(report['Missing Days'].sum()), int(report['Gaps'].sum())
+    st.write(f"**{series}** series, **{missing}** missing days in **{gaps}** gaps, "
+             f"**{int(report['Duplicate Rows'].sum())}** duplicate rows merged and "
+             f"**{int(report['Filled Values'].sum())}** values filled.")
+    st.dataframe(report.sort_values('Missing Days', ascending=False), hide_index=True)
 
 def data_preview():
     # Title with styling
@@ -24,15 +34,36 @@ def data_preview():
     
     # Step 1: Uploading the file
     st.markdown("<h4 style='color: #FF7F50;'>Step 1: Upload Your Dataset</h4>", unsafe_allow_html=True)
-    uploaded_file = st.file_uploader("Upload your dataset (Excel file - .xlsx)", type=["xlsx"])
+    uploaded_file = st.file_uploader("Upload your dataset (Excel, CSV, Parquet or Arrow/Feather)", type=SUPPORTED_TYPES)
     
     if uploaded_file:
         # Success message and progress bar
         st.success("File uploaded successfully!")
         progress = st.progress(0)
         
-        # Load data
-        data = pd.read_excel(uploaded_file)
+        # Load data, reading only the columns the analysis needs
+        # Hashed once per rerun; the column listing, the store key and the load all reuse it.
+        digest = content_hash(uploaded_file)
+        try:
+            available_columns = dataset_columns(uploaded_file, digest)
+        except Exception as e:
+            st.error(f"Could not read {uploaded_file.name}: {e}")
+            return None
+        with st.expander("Columns to Load"):
+            columns = st.multiselect("Columns", options=available_columns, default=analysis_columns(available_columns))
+        # The store keeps one read-only copy per file and column selection for all sessions,
+        # so reruns and other analysts uploading the same file skip loading altogether.
+        store = get_dataset_store()
+        key = source_key(uploaded_file, columns, digest)
+        handle = store.open(key)
+        if handle is None:
+            try:
+                data = load(uploaded_file, columns=columns or None, digest=digest)
+            except Exception as e:
+                st.error(f"Could not load {uploaded_file.name}: {e}")
+                return None
+            handle = store.put(data, name=uploaded_file.name, key=key)
+        data = handle.data
         progress.progress(50)
         
         # Display data preview
@@ -53,23 +84,32 @@ def data_preview():
             st.write(data.describe())
         
         # Handle missing data button
+        with st.expander("Missing Data Options"):
+            group_columns = st.multiselect("Series Columns", options=list(data.columns.drop('Date', errors='ignore')),
+                                           default=series_columns(data),
+                                           help="Each combination of these columns is cleaned as its own daily series.")
+            method = st.selectbox("Fill Missing Volumes With", options=list(METHODS), format_func=METHODS.get)
         if st.button("Handle Missing Data"):
-            data = handle_missing_data(data)
+            handle, report = handle_missing_data(handle, group_columns, method)
+            data = handle.data
             
-            # Store the cleaned data into session state
-            st.session_state.cleaned_data = data
+            # Keep a handle to the cleaned data and its gap report in session state
+            st.session_state.cleaned_data = handle
+            st.session_state.gap_report = report
         
         # After cleaning, show the updated data summary
         if "cleaned_data" in st.session_state:
             st.markdown("<h4 style='color: #FF7F50;'>Updated Data Summary (After Handling Missing Data)</h4>", unsafe_allow_html=True)
-            cleaned_data = st.session_state.cleaned_data
+            cleaned_data = st.session_state.cleaned_data.data
             st.write("**Dataset Shape**:", cleaned_data.shape)
             st.write("**Data Types**:", cleaned_data.dtypes)
             st.write("**Missing Values**:", cleaned_data.isnull().sum())
             st.write("**Basic Statistics**:")
             st.write(cleaned_data.describe())
+            if st.session_state.get('gap_report') is not None:
+                gap_report_view(st.session_state.gap_report)
         
-        return data
+        return handle
     else:
         st.warning("Please upload a file to proceed.")
         return None
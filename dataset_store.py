@@ -0,0 +1,252 @@
+import hashlib
+import os
+import threading
+import time
+import weakref
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from ingest import content_hash, downcast
+from model_cache import CACHE_DIR
+from util import atomic_path, process_singleton
+
+STORE_LIMIT_MB = int(os.environ.get("FLAVOUR_STORE_MB", "2048"))
+# Datasets at least this large are written to an Arrow file and memory-mapped, so the OS
+# can page them in and out instead of them counting against the process heap.
+MMAP_THRESHOLD_MB = int(os.environ.get("FLAVOUR_STORE_MMAP_MB", "64"))
+# Memory-mapped datasets don't count against STORE_LIMIT_MB but against this disk budget.
+DISK_LIMIT_MB = int(os.environ.get("FLAVOUR_STORE_DISK_MB", "8192"))
+
+MB = 1024 * 1024
+
+
+def frame_key(data):
+    """Content hash of a DataFrame: its column names, dtypes and values."""
+    digest = hashlib.sha256()
+    digest.update(repr([(str(column), str(dtype)) for column, dtype in data.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def source_key(source, columns=None, digest=None):
+    """Key of an uploaded file loaded with the given columns, available before the file is parsed."""
+    return hashlib.sha256(f"{digest or content_hash(source)}:{sorted(columns or [])}".encode()).hexdigest()
+
+
+def derived_key(key, step):
+    """Key of a dataset derived from the dataset `key` by a deterministic step such as cleaning."""
+    return hashlib.sha256(f"{key}:{step}".encode()).hexdigest()
+
+
+def _to_table(data):
+    # Floats keep NaN as a value instead of becoming Arrow nulls, so they convert back to
+    # pandas without a copy.
+    arrays = [pa.array(data[column], from_pandas=not pd.api.types.is_float_dtype(data[column]))
+              for column in data.columns]
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in data.columns])
+
+
+class DatasetHandle:
+    """A session's reference to a stored dataset; the store keeps the dataset while any handle to it is alive."""
+
+    def __init__(self, store, key, name):
+        self.key = key
+        self.name = name
+        self._store = store
+        self._data = None
+        weakref.finalize(self, store._release, key)
+
+    @property
+    def data(self):
+        """The dataset as a DataFrame whose arrays are read-only and shared with every other session.
+
+        Columns may still be added or replaced on it; that only affects this handle's frame.
+        """
+        if self._data is None:
+            self._data = self._store._frame(self.key).copy(deep=False)
+        return self._data
+
+    def __repr__(self):
+        return f"DatasetHandle({self.name!r}, {self.key[:12]})"
+
+
+class DatasetStore:
+    """Process-wide, content-addressed store of read-only datasets shared by every session.
+
+    Each dataset is held once, as an Arrow table in compact dtypes (memory-mapped from disk
+    when large), and sessions hold DatasetHandles instead of DataFrames. Datasets no
+    session references any more stay around until the store exceeds its memory limit, so
+    a re-upload of the same file is free; then the least recently used of them are evicted.
+    """
+
+    def __init__(self, directory=None, limit_mb=STORE_LIMIT_MB, mmap_threshold_mb=MMAP_THRESHOLD_MB,
+                 disk_limit_mb=DISK_LIMIT_MB):
+        self.directory = os.path.join(directory or CACHE_DIR, "store")
+        self.limit = limit_mb * MB
+        self.mmap_threshold = mmap_threshold_mb * MB
+        self.disk_limit = disk_limit_mb * MB
+        self._entries = {}
+        self._lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._remove_orphans()
+
+    def _remove_orphans(self):
+        """Delete Arrow files left behind by earlier processes; nothing in a new store refers to them."""
+        for name in os.listdir(self.directory):
+            if name.endswith((".arrow", ".tmp")):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.arrow")
+
+    def _map(self, key, table):
+        path = self._path(key)
+        if not os.path.exists(path):
+            with atomic_path(path) as tmp_path:
+                with pa.OSFile(tmp_path, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        return ipc.open_file(pa.memory_map(path)).read_all(), path
+
+    def put(self, data, name=None, key=None):
+        """Store a DataFrame and return a handle to it; identical content is stored only once."""
+        key = key or frame_key(data)
+        with self._lock:
+            if key not in self._entries:
+                table = _to_table(downcast(data))
+                path = None
+                if table.nbytes >= self.mmap_threshold:
+                    table, path = self._map(key, table)
+                self._entries[key] = {
+                    'name': name or key[:12], 'table': table, 'frame': None, 'frame_bytes': 0, 'derived': {},
+                    'path': path, 'refs': 0, 'last_used': time.time(),
+                }
+            handle = self._open(key, name)
+            self._evict()
+        return handle
+
+    def open(self, key, name=None):
+        """A new handle to a dataset already in the store, or None."""
+        with self._lock:
+            return self._open(key, name) if key in self._entries else None
+
+    def _open(self, key, name):
+        entry = self._entries[key]
+        entry['refs'] += 1
+        entry['last_used'] = time.time()
+        return DatasetHandle(self, key, name or entry['name'])
+
+    def _release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['refs'] -= 1
+                entry['last_used'] = time.time()
+
+    def _frame(self, key):
+        with self._lock:
+            entry = self._entries[key]
+            entry['last_used'] = time.time()
+            if entry['frame'] is None:
+                # Numeric, datetime and categorical columns are zero-copy views of the Arrow
+                # buffers, which are read-only, so no session can modify the shared data.
+                frame = entry['frame'] = entry['table'].to_pandas(split_blocks=True)
+                # Text columns become object arrays, which are copies and count on top of the table.
+                entry['frame_bytes'] = sum(int(frame[column].memory_usage(deep=True, index=False))
+                                           for column in frame.columns if frame[column].dtype == object)
+                self._evict()
+            return entry['frame']
+
+    def derived(self, key, name, build):
+        """build(frame) of dataset key, built once and shared by every session until the dataset is evicted.
+
+        Use it for structures derived from a dataset, such as the Analyze Data index, so
+        sessions share them instead of each keeping its own. Objects with an nbytes
+        attribute count against the store's memory limit.
+        """
+        with self._lock:
+            entry = self._entries[key]
+            if name in entry['derived']:
+                entry['last_used'] = time.time()
+                return entry['derived'][name]
+        frame = self._frame(key)
+        # Built outside the lock so other sessions aren't blocked; a concurrent build keeps the first result.
+        value = build(frame)
+        with self._lock:
+            value = entry['derived'].setdefault(name, value)
+            self._evict()
+        return value
+
+    def _memory(self, entry):
+        derived = sum(getattr(value, 'nbytes', 0) for value in entry['derived'].values())
+        return (0 if entry['path'] else entry['table'].nbytes) + entry['frame_bytes'] + derived
+
+    def _disk(self, entry):
+        return entry['table'].nbytes if entry['path'] else 0
+
+    def _evict(self):
+        """Drop unreferenced datasets, least recently used first, until the store fits its memory and disk limits."""
+        memory = sum(self._memory(entry) for entry in self._entries.values())
+        disk = sum(self._disk(entry) for entry in self._entries.values())
+        idle = sorted((entry['last_used'], key) for key, entry in self._entries.items() if entry['refs'] <= 0)
+        for _, key in idle:
+            over_memory, over_disk = memory > self.limit, disk > self.disk_limit
+            if not (over_memory or over_disk):
+                break
+            entry = self._entries[key]
+            # Only evict datasets that count against a limit the store is over.
+            if (over_memory and self._memory(entry)) or (over_disk and self._disk(entry)):
+                memory -= self._memory(entry)
+                disk -= self._disk(entry)
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        if entry['path']:
+            try:
+                os.remove(entry['path'])
+            except OSError:
+                pass
+
+    def clear(self):
+        """Drop every dataset no session references."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry['refs'] <= 0]:
+                self._remove(key)
+
+    def report(self):
+        """Memory footprint of every stored dataset, largest first."""
+        with self._lock:
+            rows = [{
+                'Dataset': entry['name'],
+                'Key': key[:12],
+                'Rows': entry['table'].num_rows,
+                'Columns': entry['table'].num_columns,
+                'In Memory (MB)': self._memory(entry) / MB,
+                'Memory-Mapped (MB)': entry['table'].nbytes / MB if entry['path'] else 0.0,
+                'Sessions': entry['refs'],
+                'Last Used': pd.Timestamp(entry['last_used'], unit='s'),
+            } for key, entry in self._entries.items()]
+        columns = ['Dataset', 'Key', 'Rows', 'Columns', 'In Memory (MB)', 'Memory-Mapped (MB)', 'Sessions', 'Last Used']
+        report = pd.DataFrame(rows, columns=columns)
+        return report.sort_values(['In Memory (MB)', 'Memory-Mapped (MB)'], ascending=False, ignore_index=True)
+
+    @property
+    def memory_bytes(self):
+        with self._lock:
+            return sum(self._memory(entry) for entry in self._entries.values())
+
+    @property
+    def disk_bytes(self):
+        with self._lock:
+            return sum(self._disk(entry) for entry in self._entries.values())
+
+
+@process_singleton
+def get_dataset_store():
+    """Process-wide dataset store shared by every Streamlit session."""
+    return DatasetStore()
@@ -0,0 +1,75 @@
+import json
+
+import pandas as pd
+import streamlit as st
+
+from dataset_store import get_dataset_store
+from forecast_store import get_forecast_store
+from instrumentation import TRACE_MEMORY, prometheus_text, recent_stages, stage_totals
+
+MB = 1024 * 1024
+
+
+def _stage_table(records):
+    table = pd.DataFrame(records)
+    memory = table['peak'] if 'peak' in table else table['rss_growth']
+    return pd.DataFrame({
+        'Stage': table['stage'],
+        'Rows': table['rows'].astype('Int64'),
+        'Wall (ms)': table['wall'] * 1000,
+        'CPU (ms)': table['cpu'] * 1000,
+        'Memory (MB)': memory / MB,
+        'Error': table['error'] if 'error' in table else None,
+    })
+
+
+def diagnostics_panel(run_started):
+    """Admin view of the instrumentation records: this run's stages and the totals since start-up."""
+    st.write("---")
+    st.subheader("Diagnostics")
+    st.caption("Memory is the traced allocation peak per stage." if TRACE_MEMORY else
+               "Memory is how far the stage raised the process' peak memory; set FLAVOUR_TRACE_MEMORY=1 for exact per-stage peaks.")
+
+    records = recent_stages()
+    this_run = [record for record in records if record['started'] >= run_started]
+    if this_run:
+        st.markdown("**This run**")
+        st.dataframe(_stage_table(this_run).style.format(
+            {'Wall (ms)': '{:,.1f}', 'CPU (ms)': '{:,.1f}', 'Memory (MB)': '{:,.1f}'}), hide_index=True)
+    else:
+        st.info("No instrumented stages ran on this page.")
+
+    totals = stage_totals()
+    if totals:
+        st.markdown("**Since start-up**")
+        summary = pd.DataFrame.from_dict(totals, orient='index').rename_axis('Stage').reset_index()
+        summary['Mean Wall (ms)'] = summary['wall'] / summary['calls'] * 1000
+        summary['Peak Memory (MB)'] = summary['peak'] / MB
+        summary = summary.rename(columns={'calls': 'Calls', 'errors': 'Errors', 'rows': 'Rows'})
+        st.dataframe(summary[['Stage', 'Calls', 'Errors', 'Rows', 'Mean Wall (ms)', 'Peak Memory (MB)']]
+                     .sort_values('Mean Wall (ms)', ascending=False).style.format(
+                         {'Mean Wall (ms)': '{:,.1f}', 'Peak Memory (MB)': '{:,.1f}'}), hide_index=True)
+
+    store = get_dataset_store()
+    report = store.report()
+    st.markdown(f"**Dataset store** ({store.memory_bytes / MB:,.1f} MB in memory of a {store.limit / MB:,.0f} MB limit, "
+                f"{store.disk_bytes / MB:,.1f} MB memory-mapped of a {store.disk_limit / MB:,.0f} MB limit)")
+    if report.empty:
+        st.info("No datasets are stored.")
+    else:
+        st.dataframe(report.style.format({'In Memory (MB)': '{:,.1f}', 'Memory-Mapped (MB)': '{:,.1f}'}), hide_index=True)
+
+    runs = get_forecast_store().report()
+    st.markdown(f"**Forecast store** ({(runs['status'] == 'pending').sum()} runs pending)")
+    if runs.empty:
+        st.info("No forecasts are stored.")
+    else:
+        for column in ('requested', 'finished', 'backtested'):
+            runs[column] = pd.to_datetime(runs[column], unit='s')
+        st.dataframe(runs.rename(columns=str.title), hide_index=True)
+
+    left, right = st.columns(2)
+    left.download_button("Download Stage Log (JSON Lines)", "\n".join(json.dumps(record, default=str) for record in records),
+                         file_name="stages.jsonl", mime="application/json")
+    right.download_button("Download Metrics (Prometheus)", prometheus_text(totals), file_name="flavour_metrics.prom",
+                          mime="text/plain")
@@ -0,0 +1,108 @@
+"""Fast baseline models that fit and forecast a whole (series x days) matrix in one pass.
+
+Every function takes a 2-D float array with one row per series and one column per day,
+tolerates missing days (NaN), and returns a (series x horizon) array of forecasts.
+"""
+import numpy as np
+import pandas as pd
+
+SEASON = 7
+# Smoothing weights tried for every series at once; each series keeps the one with the
+# lowest in-sample one-step squared error.
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5)
+GAMMA = 0.1
+MOVING_AVERAGE_WINDOW = 28
+
+
+def _row_means(A, fallback=0.0):
+    """Mean of each row ignoring NaN; rows with no observations get `fallback`."""
+    counts = (~np.isnan(A)).sum(axis=1)
+    totals = np.nansum(A, axis=1)
+    return np.where(counts > 0, totals / np.maximum(counts, 1), fallback)
+
+
+def seasonal_naive(Y, horizon, season=SEASON):
+    """Repeat each series' last observed week."""
+    Y = np.asarray(Y, dtype='float64')
+    n_days = Y.shape[1]
+    positions = np.maximum(n_days - season + np.arange(horizon) % season, 0)
+    forecasts = Y[:, positions]
+    return np.where(np.isnan(forecasts), _row_means(Y)[:, None], forecasts)
+
+
+def moving_average(Y, horizon, window=MOVING_AVERAGE_WINDOW):
+    """Flat forecast at the mean of each series' last `window` days."""
+    Y = np.asarray(Y, dtype='float64')
+    level = _row_means(Y[:, -window:], fallback=_row_means(Y))
+    return np.repeat(level[:, None], horizon, axis=1)
+
+
+def seasonal_exponential_smoothing(Y, horizon, season=SEASON, alphas=ALPHAS, gamma=GAMMA):
+    """Additive level + weekly seasonality exponential smoothing, vectorized over series and alphas.
+
+    The recursion runs once over the days, updating every (series, alpha) pair together.
+    Missing days leave the state unchanged.
+    """
+    Y = np.asarray(Y, dtype='float64')
+    n_series, n_days = Y.shape
+    alphas = np.asarray(alphas, dtype='float64')[None, :]
+
+    first_week = Y[:, :season]
+    level0 = _row_means(first_week, fallback=_row_means(Y))
+    seasonal = np.nan_to_num(first_week - level0[:, None])
+    if seasonal.shape[1] < season:
+        seasonal = np.pad(seasonal, ((0, 0), (0, season - seasonal.shape[1])))
+
+    level = np.repeat(level0[:, None], alphas.shape[1], axis=1)
+    seasonal = np.repeat(seasonal[:, None, :], alphas.shape[1], axis=1)
+    sse = np.zeros_like(level)
+    for t in range(n_days):
+        position = t % season
+        y = Y[:, t, None]
+        observed = ~np.isnan(y)
+        prediction = level + seasonal[:, :, position]
+        error = np.where(observed, y - prediction, 0.0)
+        sse += error ** 2
+        new_level = level + alphas * error
+        seasonal[:, :, position] += gamma * (1 - alphas) * error
+        level = new_level
+
+    best = np.argmin(sse, axis=1)
+    rows = np.arange(n_series)
+    level = level[rows, best]
+    seasonal = seasonal[rows, best]
+    positions = (n_days + np.arange(horizon)) % season
+    return level[:, None] + seasonal[:, positions]
+
+
+MODELS = {
+    'snaive': seasonal_naive,
+    'ets': seasonal_exponential_smoothing,
+    'ma': moving_average,
+}
+
+MODEL_NAMES = {
+    'snaive': "Seasonal naive",
+    'ets': "Weekly-seasonal exponential smoothing",
+    'ma': "Moving average",
+}
+
+
+def to_matrix(series):
+    """Align {key: daily Series} on one calendar; returns (keys, dates, series x days matrix)."""
+    keys = list(series)
+    frame = pd.concat([series[key].rename(i) for i, key in enumerate(keys)], axis=1).asfreq('D')
+    return keys, frame.index, frame.to_numpy(dtype='float64').T
+
+
+def forecast_matrix(Y, horizon, model='ets'):
+    if model not in MODELS:
+        raise ValueError(f"Unknown fast model: {model}. Choose from {', '.join(MODELS)}")
+    return MODELS[model](Y, horizon)
+
+
+def forecast_one(y, horizon, model='ets'):
+    """Forecast a single daily Series with a fast model, indexed by the following days."""
+    values = forecast_matrix(np.asarray(y, dtype='float64')[None, :], horizon, model)[0]
+    dates = pd.date_range(y.index[-1] + pd.Timedelta(days=1), periods=horizon, freq='D')
+    return pd.Series(values, index=dates, name='predicted_mean')
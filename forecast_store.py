@@ -0,0 +1,361 @@
+"""Shared store of precomputed SARIMAX forecasts, refreshed by background workers.
+
+A stored run is the baseline forecast of one dataset, target and series with one set of
+model settings, fitted on one version of the data: HORIZON days of forecast with its
+prediction interval, the holdout actuals with their metrics and a rolling-origin backtest.
+Runs live in an SQLite database in the cache directory, so every session and every app
+or CLI process on the machine reads the same results.
+
+Pages ask for the forecast of the data they have. When no run exists for that data
+version one is claimed in the database and computed by a worker thread; every other
+session asking for it meanwhile waits on that one run instead of fitting again, and can
+show the latest earlier version until it is ready. A run is ready as soon as its model is
+fitted; its rolling-origin backtest is queued behind every pending fit and fills in the
+backtest metrics later.
+"""
+import contextlib
+import hashlib
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtesting import METRICS, backtest
+from instrumentation import stage
+from model_cache import CACHE_DIR, lineage_key
+from pipeline import ORDER, SEASONAL_ORDER, TARGETS, TRAIN_FRACTION, evaluate_forecast, fit_sarimax, to_daily
+from util import process_singleton
+
+# Days of forecast stored per run; pages show the first forecast_days of them.
+HORIZON = 365
+INTERVAL = 0.95
+BACKTEST_HORIZON = 14
+BACKTEST_WORKERS = int(os.environ.get("FLAVOUR_REFRESH_BACKTEST_WORKERS", "1"))
+REFRESH_THREADS = int(os.environ.get("FLAVOUR_REFRESH_THREADS", "1"))
+# Finished runs kept per dataset, target, series and settings; older versions are deleted.
+KEEP_VERSIONS = 5
+# A run still pending after this many seconds is assumed lost with its process and is
+# claimed again; a failed run is retried after RETRY_AFTER seconds.
+STALE_AFTER = 900
+RETRY_AFTER = 600
+POLL_INTERVAL = 0.2
+# Refresh workers take every queued fit before any queued backtest.
+FIT_PRIORITY, BACKTEST_PRIORITY = 0, 1
+# Pages never wait for a fit: they give a run about to finish this long, then show an
+# earlier version or the fallback and pick the run up on a later rerun.
+PAGE_WAIT = 0.5
+
+ALL_SERIES = 'All'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    target TEXT NOT NULL,
+    series TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    data_version TEXT NOT NULL,
+    lineage TEXT,
+    length INTEGER,
+    status TEXT NOT NULL,
+    error TEXT,
+    requested REAL NOT NULL,
+    finished REAL,
+    backtested REAL,
+    UNIQUE (dataset, target, series, spec, data_version)
+);
+CREATE TABLE IF NOT EXISTS forecasts (
+    run_id INTEGER NOT NULL, date TEXT NOT NULL, forecast REAL, lower REAL, upper REAL,
+    PRIMARY KEY (run_id, date)
+);
+CREATE TABLE IF NOT EXISTS actuals (
+    run_id INTEGER NOT NULL, date TEXT NOT NULL, actual REAL,
+    PRIMARY KEY (run_id, date)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL, kind TEXT NOT NULL, horizon INTEGER NOT NULL, metric TEXT NOT NULL, value REAL,
+    PRIMARY KEY (run_id, kind, horizon, metric)
+);
+"""
+
+
+def data_version(y):
+    """Content hash of a daily series: its dates and values."""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(y.to_numpy(dtype="float64")).tobytes())
+    digest.update(np.ascontiguousarray(y.index.asi8).tobytes())
+    return digest.hexdigest()
+
+
+def model_spec(order=ORDER, seasonal_order=SEASONAL_ORDER, train_fraction=TRAIN_FRACTION):
+    return json.dumps({'model': 'sarimax', 'order': list(order), 'seasonal_order': list(seasonal_order),
+                       'train_fraction': train_fraction}, sort_keys=True)
+
+
+def _dates(index):
+    return [day.strftime('%Y-%m-%d') for day in pd.DatetimeIndex(index)]
+
+
+class ForecastStore:
+    """Versioned forecasts, intervals and metrics in SQLite, computed once and shared by every session."""
+
+    def __init__(self, path=None, threads=REFRESH_THREADS):
+        self.path = path or os.path.join(CACHE_DIR, "forecasts.sqlite")
+        self.threads = threads
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._workers = []
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            # Stores created before runs recorded their lineage; their runs never count as earlier versions.
+            columns = {row['name'] for row in db.execute("PRAGMA table_info(runs)")}
+            for column, kind in (('lineage', 'TEXT'), ('length', 'INTEGER'), ('backtested', 'REAL')):
+                if column not in columns:
+                    db.execute(f"ALTER TABLE runs ADD COLUMN {column} {kind}")
+            if 'backtested' not in columns:
+                # Runs used to be backtested before they were marked 'ok'.
+                db.execute("UPDATE runs SET backtested = finished WHERE status = 'ok'")
+
+    def _connect(self):
+        # Autocommit; writes group themselves with _transaction.
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        return contextlib.closing(db)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def _claim(self, dataset, target, series, spec, y, order, seasonal_order):
+        """The run for this version of y and whether the caller must compute it."""
+        now = time.time()
+        version = data_version(y)
+        with self._transaction() as db:
+            row = db.execute("SELECT id, status, requested, finished FROM runs WHERE dataset = ? AND target = ? "
+                             "AND series = ? AND spec = ? AND data_version = ?",
+                             (dataset, target, series, spec, version)).fetchone()
+            if row is None:
+                cursor = db.execute("INSERT INTO runs (dataset, target, series, spec, data_version, lineage, length, "
+                                    "status, requested) VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', ?)",
+                                    (dataset, target, series, spec, version,
+                                     lineage_key(y, target, order, seasonal_order), len(y), now))
+                return cursor.lastrowid, True
+            lost = row['status'] == 'pending' and now - row['requested'] > STALE_AFTER
+            retry = row['status'] == 'failed' and now - row['finished'] > RETRY_AFTER
+            if lost or retry:
+                db.execute("UPDATE runs SET status = 'pending', error = NULL, requested = ?, finished = NULL WHERE id = ?",
+                           (now, row['id']))
+                return row['id'], True
+            return row['id'], False
+
+    def request(self, dataset, target, y, series=ALL_SERIES, order=ORDER, seasonal_order=SEASONAL_ORDER,
+                train_fraction=TRAIN_FRACTION):
+        """Queue a background refresh for y unless its run exists or is already being computed; returns the run id."""
+        spec = model_spec(order, seasonal_order, train_fraction)
+        run_id, claimed = self._claim(dataset, target, series, spec, y, order, seasonal_order)
+        if claimed:
+            self._submit(FIT_PRIORITY, self._fit_then_queue_backtest, run_id, y, target, order, seasonal_order,
+                         train_fraction)
+        return run_id
+
+    def refresh(self, dataset, target, y, series=ALL_SERIES, order=ORDER, seasonal_order=SEASONAL_ORDER,
+                train_fraction=TRAIN_FRACTION):
+        """Compute the run for y in the calling thread, unless it exists or another worker has it; returns the run."""
+        spec = model_spec(order, seasonal_order, train_fraction)
+        run_id, claimed = self._claim(dataset, target, series, spec, y, order, seasonal_order)
+        if claimed:
+            if self._compute(run_id, y, target, order, seasonal_order, train_fraction):
+                self._backtest(run_id, y, order, seasonal_order)
+            return self.run(run_id)
+        return self.wait(run_id, timeout=STALE_AFTER)
+
+    def _start_workers(self):
+        with self._lock:
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            while len(self._workers) < self.threads:
+                worker = threading.Thread(target=self._work, name='forecast-refresh', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _submit(self, priority, function, *args):
+        self._start_workers()
+        # The sequence number keeps tasks of one priority in order and stops ties from comparing functions.
+        self._queue.put((priority, next(self._sequence), function, args))
+
+    def _work(self):
+        while True:
+            _, _, function, args = self._queue.get()
+            function(*args)
+
+    def _fit_then_queue_backtest(self, run_id, y, target, order, seasonal_order, train_fraction):
+        if self._compute(run_id, y, target, order, seasonal_order, train_fraction):
+            self._submit(BACKTEST_PRIORITY, self._backtest, run_id, y, order, seasonal_order)
+
+    def _compute(self, run_id, y, target, order, seasonal_order, train_fraction):
+        """Fit the run's model and store its forecast, interval and holdout metrics; returns whether it succeeded."""
+        try:
+            with stage('forecast_refresh', rows=len(y)):
+                train_size = int(train_fraction * len(y))
+                results = fit_sarimax(y, train_size, target, order, seasonal_order)
+                actuals = y[train_size:]
+                prediction = results.get_forecast(steps=max(HORIZON, len(actuals)))
+                bounds = np.asarray(prediction.conf_int(alpha=1 - INTERVAL))
+                forecast_values = prediction.predicted_mean
+                holdout = evaluate_forecast(forecast_values, actuals) if len(actuals) else {}
+        except Exception as e:
+            with self._transaction() as db:
+                db.execute("UPDATE runs SET status = 'failed', error = ?, finished = ? WHERE id = ?",
+                           (f"{type(e).__name__}: {e}", time.time(), run_id))
+            return False
+
+        metrics = [(run_id, 'holdout', 0, name, float(value)) for name, value in holdout.items()]
+        with self._transaction() as db:
+            db.executemany("INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?)",
+                           zip([run_id] * len(forecast_values), _dates(forecast_values.index),
+                               forecast_values.to_numpy(dtype=float), bounds[:, 0], bounds[:, 1]))
+            db.executemany("INSERT OR REPLACE INTO actuals VALUES (?, ?, ?)",
+                           zip([run_id] * len(actuals), _dates(actuals.index), actuals.to_numpy(dtype=float)))
+            db.executemany("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?)", metrics)
+            db.execute("UPDATE runs SET status = 'ok', finished = ? WHERE id = ?", (time.time(), run_id))
+            self._prune(db, run_id)
+        return True
+
+    def _backtest(self, run_id, y, order, seasonal_order):
+        """Add the rolling-origin backtest metrics to a finished run."""
+        try:
+            with stage('forecast_backtest', rows=len(y)):
+                _, by_horizon = backtest(y, BACKTEST_HORIZON, order=order, seasonal_order=seasonal_order,
+                                         workers=BACKTEST_WORKERS)
+        except Exception:
+            # Too short to backtest, or a fold failed; the run keeps its forecast without backtest metrics.
+            by_horizon = None
+        metrics = [] if by_horizon is None else [
+            (run_id, 'backtest', int(horizon), name, float(value))
+            for horizon, row in by_horizon.iterrows() for name, value in row.items()]
+        with self._transaction() as db:
+            # The run may have been pruned while its backtest waited in the queue.
+            if db.execute("SELECT 1 FROM runs WHERE id = ?", (run_id,)).fetchone() is None:
+                return
+            db.executemany("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?)", metrics)
+            db.execute("UPDATE runs SET backtested = ? WHERE id = ?", (time.time(), run_id))
+
+    def _prune(self, db, run_id):
+        """Delete finished versions beyond the KEEP_VERSIONS newest of the run's dataset, target, series and settings."""
+        old = db.execute("SELECT id FROM runs WHERE status != 'pending' AND (dataset, target, series, spec) = "
+                         "(SELECT dataset, target, series, spec FROM runs WHERE id = ?) "
+                         "ORDER BY finished DESC LIMIT -1 OFFSET ?", (run_id, KEEP_VERSIONS)).fetchall()
+        for (old_id,) in old:
+            for table in ('forecasts', 'actuals', 'metrics'):
+                db.execute(f"DELETE FROM {table} WHERE run_id = ?", (old_id,))
+            db.execute("DELETE FROM runs WHERE id = ?", (old_id,))
+
+    def run(self, run_id):
+        """A stored run as a dict, with its forecast, actuals and holdout metrics once it is 'ok'.
+
+        'backtest' holds the backtest metrics by horizon, or None until the run's backtest
+        has finished (its 'backtested' time is set then) or when the series was too short.
+        """
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+            if row is None:
+                return None
+            entry = dict(row)
+            entry['spec'] = json.loads(entry['spec'])
+            if entry['status'] != 'ok':
+                return entry
+            entry['forecast'] = pd.read_sql_query(
+                "SELECT date AS Date, forecast AS Forecast, lower AS Lower, upper AS Upper FROM forecasts "
+                "WHERE run_id = ? ORDER BY date", db, params=(run_id,), parse_dates=['Date'], index_col='Date')
+            entry['actuals'] = pd.read_sql_query(
+                "SELECT date AS Date, actual FROM actuals WHERE run_id = ? ORDER BY date", db, params=(run_id,),
+                parse_dates=['Date'], index_col='Date')['actual'].rename(entry['target'])
+            metrics = pd.read_sql_query("SELECT kind, horizon, metric, value FROM metrics WHERE run_id = ?", db,
+                                        params=(run_id,))
+        holdout = metrics[metrics['kind'] == 'holdout']
+        entry['holdout'] = dict(zip(holdout['metric'], holdout['value']))
+        backtested = metrics[metrics['kind'] == 'backtest']
+        entry['backtest'] = None if backtested.empty else (
+            backtested.pivot(index='horizon', columns='metric', values='value')
+            .rename_axis(index='Horizon', columns=None)[METRICS])
+        return entry
+
+    def wait(self, run_id, timeout):
+        """The run once it finished (ok or failed), or None if it is still pending after timeout seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            entry = self.run(run_id)
+            if entry is not None and entry['status'] != 'pending':
+                return entry
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(POLL_INTERVAL)
+
+    def latest(self, dataset, target, y, series=ALL_SERIES, order=ORDER, seasonal_order=SEASONAL_ORDER,
+               train_fraction=TRAIN_FRACTION):
+        """The most recently finished successful run on this or an earlier version of y, or None.
+
+        An earlier version is a series y starts with: the same days and values up to the
+        run's last day, with y having appended the days since. Another dataset uploaded
+        under the same name never matches.
+        """
+        with self._connect() as db:
+            rows = db.execute("SELECT id, data_version, length FROM runs WHERE dataset = ? AND target = ? AND series = ? "
+                              "AND spec = ? AND lineage = ? AND length <= ? AND status = 'ok' ORDER BY finished DESC",
+                              (dataset, target, series, model_spec(order, seasonal_order, train_fraction),
+                               lineage_key(y, target, order, seasonal_order), len(y))).fetchall()
+        for row in rows:
+            if data_version(y[:row['length']]) == row['data_version']:
+                return self.run(row['id'])
+        return None
+
+    def get(self, dataset, target, y, series=ALL_SERIES, order=ORDER, seasonal_order=SEASONAL_ORDER,
+            train_fraction=TRAIN_FRACTION, wait=0):
+        """The stored run for y, requesting it in the background when it is new.
+
+        Waits up to `wait` seconds for a run that is still being computed. Returns
+        (entry, current): the run for this data version (which may have failed) with
+        current True, else the latest earlier successful version with current False, or
+        (None, False) when there is none yet.
+        """
+        run_id = self.request(dataset, target, y, series, order, seasonal_order, train_fraction)
+        entry = self.wait(run_id, wait)
+        if entry is not None:
+            return entry, True
+        return self.latest(dataset, target, y, series, order, seasonal_order, train_fraction), False
+
+    def report(self):
+        """Every run, newest first, without its values."""
+        with self._connect() as db:
+            return pd.read_sql_query("SELECT id, dataset, target, series, status, error, requested, finished, "
+                                     "backtested FROM runs ORDER BY requested DESC", db)
+
+
+def refresh_dataset(store, dataset, data):
+    """Queue default-settings forecasts of every target in a newly uploaded dataset."""
+    targets = [target for target in TARGETS if target in data.columns]
+    if 'Date' not in data.columns or not targets:
+        return []
+    daily = to_daily(data)
+    return [store.request(dataset, target, daily[target]) for target in targets]
+
+
+@process_singleton
+def get_forecast_store():
+    """Process-wide forecast store shared by every Streamlit session."""
+    return ForecastStore()
@@ -1,49 +1,76 @@
+import os
+
+import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.graph_objects as go
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-from sklearn.preprocessing import LabelEncoder
+from batch_forecasting import BATCH_MODELS, DEFAULT_TIMEOUT, batch_forecast
+from fast_models import MODEL_NAMES
+from forecast_store import INTERVAL, PAGE_WAIT, get_forecast_store
+from instrumentation import stage
+from probabilistic import PATHS, QUANTILES, UPLIFT_SPREAD, quantile_label
+from order_search import CRITERIA, search_orders
+from pipeline import (FALLBACK_MODEL, ORDER, PROMOTION_TYPES, SEASONAL_ORDER, TARGETS,
+                      TRAIN_FRACTION, adjust_forecast, forecast_quantiles, forecast_with_fallback, to_daily)
+from scenarios import evaluate_scenarios, event_calendar, scenario_grid
+
+MODEL_LABELS = {'sarimax': "SARIMAX", **MODEL_NAMES}
 
-def forecast(data):
+def forecast(data, dataset=None):
     st.title("Demand Forecasting for the Next X Days")
     
     forecast_days = st.number_input("Select the number of days to forecast", min_value=1, max_value=365, value=30, step=1)
 
-    target = st.selectbox("Select Target Attribute", options=["Sales Volume", "Demand Volume"])
+    target = st.selectbox("Select Target Attribute", options=TARGETS)
 
-    data['Date'] = pd.to_datetime(data['Date'])
-    data = data.set_index('Date')
-    
-    if data.index.duplicated().any():
+    if pd.to_datetime(data['Date']).duplicated().any():
         st.warning("There are duplicate entries for some dates. These will be aggregated.")
-        data = data.groupby('Date').agg({
-            'Sales Volume': 'sum',
-            'Demand Volume': 'sum',
-            'Remaining Volume': 'sum',
-            'Production Volume': 'sum',
-            'Temperature': 'mean',
-            'Humidity': 'mean',
-            'Consumer Price Index': 'mean',
-            'Economic Indicator': 'mean',
-            'Disposable Income Level': 'mean'
-        })
-    
-    data = data.sort_index()
-    data = data.asfreq('D', method='pad')
+    data = to_daily(data)
     
     y = data[target]
-    train_size = int(0.8 * len(y))
-    train_data = y[:train_size]
-    test_data = y[train_size:]
-
-    model = SARIMAX(train_data, seasonal_order=(1, 1, 1, 7), order=(1, 1, 1))
-    results = model.fit(disp=False)
-
-    forecast_values = results.get_forecast(steps=forecast_days).predicted_mean
+    model = st.selectbox("Forecasting Model", options=BATCH_MODELS, format_func=MODEL_LABELS.get,
+                         help="The fast models forecast instantly but ignore everything except the weekly pattern.")
+    order, seasonal_order = ORDER, SEASONAL_ORDER
+    if model == 'sarimax':
+        if st.checkbox("Select Model Orders Automatically", help="Search SARIMA orders instead of using the default (1,1,1)(1,1,1,7)."):
+            criterion = st.selectbox("Selection Criterion", options=CRITERIA,
+                                     format_func={'aic': "AIC", 'bic': "BIC", 'holdout': "Holdout error (MAE)"}.get)
+            stepwise = st.checkbox("Stepwise Search", value=True, help="Much faster than the full grid, but may miss the best model.")
+            with st.spinner("Searching model orders..."):
+                order, seasonal_order, candidates = search_orders(y[:int(TRAIN_FRACTION * len(y))], target, criterion, stepwise=stepwise)
+            st.write(f"**Selected model:** SARIMA{order}x{seasonal_order}")
+            with st.expander("All Evaluated Candidates"):
+                st.dataframe(candidates, hide_index=True)
+    interval, current = None, False
+    if model == 'sarimax':
+        # SARIMAX forecasts come from the shared store: computed once per data version by a
+        # background worker and read by every session.
+        entry, current = get_forecast_store().get(dataset or "upload", target, y, order=order,
+                                                  seasonal_order=seasonal_order, wait=PAGE_WAIT)
+        if entry is not None and entry['status'] == 'ok':
+            interval = entry['forecast'][:forecast_days]
+            forecast_values, test_data = interval['Forecast'], entry['actuals']
+            if not current:
+                st.info(f"Showing the forecast computed {pd.Timestamp(entry['finished'], unit='s'):%Y-%m-%d %H:%M} "
+                        "for an earlier version of this data; the current one is being computed in the background.")
+        else:
+            forecast_values, test_data, used, _ = forecast_with_fallback(y, target, forecast_days, model=FALLBACK_MODEL)
+            if entry is not None and current:
+                st.warning(f"SARIMAX failed: {entry['error']}, so this forecast uses {MODEL_LABELS[used]}.")
+            else:
+                st.warning(f"The SARIMAX forecast for this data is still being computed in the background, so this "
+                           f"forecast uses {MODEL_LABELS[used]}. Check again in a moment to use it.")
+                st.button("Check Again")
+    else:
+        forecast_values, test_data, _, _ = forecast_with_fallback(y, target, forecast_days, model=model)
     
     st.subheader(f"Baseline Demand Forecast for the Next {forecast_days} Days")
     
     fig = go.Figure()
+    if interval is not None:
+        fig.add_trace(go.Scatter(y=interval['Upper'], mode='lines', line=dict(width=0), showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(y=interval['Lower'], mode='lines', line=dict(width=0), fill='tonexty',
+                                 fillcolor='rgba(0, 0, 255, 0.15)', name=f"{INTERVAL:.0%} Prediction Interval", hoverinfo='skip'))
     fig.add_trace(go.Scatter(y=forecast_values, mode='lines', name='Forecasted Demand',
                              line=dict(color='blue', width=2),
                              text=[f"<b>{val:.2f}</b>" for val in forecast_values],
@@ -64,31 +91,18 @@ def forecast(data):
         legend=dict(font=dict(size=12, color='white'))
     )
     
-    st.plotly_chart(fig)
+    with stage('render_chart'):
+        st.plotly_chart(fig)
     
     st.write("Now, adjust the forecast based on external factors:")
     
     num_holidays = st.number_input(f"Number of Holidays in the Next {forecast_days} Days", min_value=0, value=0)
     num_concerts = st.number_input(f"Number of Concerts/Festivals in the Next {forecast_days} Days", min_value=0, value=0)
-    promotion_type = st.selectbox("Promotion Type", options=["None", "Discount", "BOGO", "Others"])
+    promotion_type = st.selectbox("Promotion Type", options=PROMOTION_TYPES)
     discount_amount = st.number_input("Discount Amount (%)", min_value=0, max_value=100, value=0)
 
-    deviation_summary = []
-    
-    holiday_increase = num_holidays * 0.02 
-    deviation_summary.append(f"{holiday_increase * 100:.1f}% increase due to {num_holidays} holidays.")
-    
-    concert_increase = num_concerts * 0.015 
-    deviation_summary.append(f"{concert_increase * 100:.1f}% increase due to {num_concerts} concerts/festivals.")
-    
-    if promotion_type != "None":
-        promotion_increase = discount_amount * 0.005 
-        deviation_summary.append(f"{promotion_increase * 100:.1f}% increase from a {discount_amount}% {promotion_type.lower()} promotion.")
-    else:
-        promotion_increase = 0
-    
-    total_increase_percentage = holiday_increase + concert_increase + promotion_increase
-    adjusted_forecast_values = forecast_values * (1 + total_increase_percentage)
+    adjusted_forecast_values, total_increase_percentage, deviation_summary = adjust_forecast(
+        forecast_values, num_holidays, num_concerts, promotion_type, discount_amount)
     
     st.subheader(f"Adjusted Demand Forecast for the Next {forecast_days} Days (with External Factors)")
     
@@ -113,7 +127,8 @@ def forecast(data):
         legend=dict(font=dict(size=12, color='white'))
     )
     
-    st.plotly_chart(fig_adjusted)
+    with stage('render_chart'):
+        st.plotly_chart(fig_adjusted)
     
     if deviation_summary:
         st.subheader("Detailed Impact of External Factors on Demand Forecast")
@@ -123,4 +138,134 @@ def forecast(data):
     
     st.write(f"The overall adjustment applied to the forecast is an increase of {total_increase_percentage * 100:.1f}%.")
     
+    # Only for a stored run of this very data: its fit is in the model cache, so the paths
+    # come from the model drawn above without fitting in the page.
+    if interval is not None and current:
+        probabilistic_view(y, target, forecast_days, order, seasonal_order,
+                           num_holidays, num_concerts, promotion_type, discount_amount)
+    
+    scenario_view(forecast_values)
+    
     return adjusted_forecast_values, test_data
+
+def probabilistic_view(y, target, forecast_days, order, seasonal_order, num_holidays, num_concerts, promotion_type,
+                       discount_amount):
+    st.subheader("Probabilistic Forecast for Production Planning")
+    st.write("Simulate thousands of demand paths from the fitted model, with uncertain uplifts for the external factors above, "
+             "and plan production from their quantiles.")
+    if not st.checkbox("Show Probabilistic Forecast"):
+        return
+
+    paths = st.number_input("Sample Paths", min_value=100, max_value=100000, value=PATHS, step=1000)
+    spread = st.number_input("Uplift Uncertainty (%)", min_value=0, max_value=200, value=int(UPLIFT_SPREAD * 100), step=5,
+                             help="Relative standard deviation of each external factor's uplift around the value used above.")
+    daily, cumulative = forecast_quantiles(y, target, forecast_days, order=order, seasonal_order=seasonal_order,
+                                           num_holidays=num_holidays, num_concerts=num_concerts,
+                                           promotion_type=promotion_type, discount_amount=discount_amount,
+                                           spread=spread / 100, paths=int(paths))
+    low, mid, high = (quantile_label(q) for q in QUANTILES)
+
+    total = cumulative.iloc[-1]
+    st.write(f"**Total demand over the next {forecast_days} days:** {low} {total[low]:,.0f}, "
+             f"{mid} {total[mid]:,.0f}, {high} {total[high]:,.0f}")
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=daily.index, y=daily[high], mode='lines', line=dict(width=0), showlegend=False))
+    fig.add_trace(go.Scatter(x=daily.index, y=daily[low], mode='lines', line=dict(width=0), fill='tonexty',
+                             fillcolor='rgba(255, 0, 0, 0.2)', name=f"{low}-{high}"))
+    fig.add_trace(go.Scatter(x=daily.index, y=daily[mid], mode='lines', name=mid, line=dict(color='red', width=2)))
+    fig.update_layout(title="Daily Demand Quantiles", xaxis_title="Date", yaxis_title="Demand Volume")
+    with stage('render_chart'):
+        st.plotly_chart(fig)
+
+    quantiles = pd.concat({'Daily': daily, 'Cumulative': cumulative}, axis=1)
+    quantiles.columns = [f"{kind} {column}" for kind, column in quantiles.columns]
+    st.dataframe(quantiles.style.format('{:,.0f}'))
+    st.download_button("Download Quantiles (CSV)", quantiles.to_csv(), file_name="demand_quantiles.csv", mime="text/csv")
+
+def _parse_percentages(text):
+    return [float(value) / 100 for value in text.replace(";", ",").split(",") if value.strip()]
+
+def scenario_view(forecast_values):
+    st.subheader("Compare What-If Scenarios")
+    st.write("Mark event days in the calendar and list the uplifts to try. Every combination is evaluated against the baseline forecast without refitting the model.")
+
+    calendar = pd.DataFrame({
+        'Date': forecast_values.index,
+        'Holiday': False,
+        'Concert': False,
+        'Discount (%)': 0.0
+    })
+    calendar = st.data_editor(calendar, disabled=['Date'], hide_index=True, key="scenario_calendar")
+
+    holiday_uplifts = st.text_input("Uplift per Holiday Day (%)", "10, 20, 30")
+    concert_uplifts = st.text_input("Uplift per Concert/Festival Day (%)", "5, 10, 15")
+    discount_uplifts = st.text_input("Uplift per Discount Percentage Point on Promotion Days (%)", "0.25, 0.5, 0.75")
+
+    try:
+        grid = scenario_grid(_parse_percentages(holiday_uplifts), _parse_percentages(concert_uplifts),
+                             _parse_percentages(discount_uplifts))
+    except ValueError:
+        st.error("Uplifts must be comma-separated numbers.")
+        return
+    if grid.empty:
+        st.warning("Enter at least one uplift for every event type.")
+        return
+
+    events = event_calendar(
+        calendar['Date'],
+        holidays=calendar.loc[calendar['Holiday'], 'Date'],
+        concerts=calendar.loc[calendar['Concert'], 'Date'],
+        promotions=[(day, day, discount) for day, discount in zip(calendar['Date'], calendar['Discount (%)']) if discount > 0]
+    )
+    matrix, summary = evaluate_scenarios(forecast_values, events, grid)
+
+    st.write(f"**Scenarios evaluated:** {len(summary)}")
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=events.index, y=matrix.max(axis=0), mode='lines', line=dict(width=0), showlegend=False))
+    fig.add_trace(go.Scatter(x=events.index, y=matrix.min(axis=0), mode='lines', line=dict(width=0), fill='tonexty',
+                             fillcolor='rgba(255, 0, 0, 0.2)', name='Scenario Range'))
+    fig.add_trace(go.Scatter(x=events.index, y=np.median(matrix, axis=0), mode='lines', name='Median Scenario',
+                             line=dict(color='red', width=2)))
+    fig.add_trace(go.Scatter(x=events.index, y=forecast_values, mode='lines', name='Baseline',
+                             line=dict(color='blue', width=2)))
+    fig.update_layout(title="Range of Adjusted Forecasts Across Scenarios", xaxis_title="Date", yaxis_title="Demand Volume")
+    with stage('render_chart'):
+        st.plotly_chart(fig)
+
+    st.dataframe(summary.sort_values('Total', ascending=False).style.format({
+        'Holiday Uplift': '{:.1%}', 'Concert Uplift': '{:.1%}', 'Discount Uplift': '{:.2%}',
+        'Total': '{:,.0f}', 'Uplift (%)': '{:.1f}', 'Peak Day': '{:,.0f}'
+    }), hide_index=True)
+
+def batch_forecast_view(data):
+    st.subheader("Forecast Each Group Separately")
+    st.write("Fit one model per flavour, region or any other grouping and download all forecasts at once.")
+
+    candidates = [column for column in data.columns if column != 'Date' and not pd.api.types.is_float_dtype(data[column])]
+    group_columns = st.multiselect("Group By", options=candidates)
+    target = st.selectbox("Target Attribute for Groups", options=TARGETS)
+    forecast_days = st.number_input("Days to Forecast per Group", min_value=1, max_value=365, value=30, step=1)
+    workers = st.number_input("Worker Processes", min_value=1, max_value=os.cpu_count(), value=os.cpu_count(), step=1)
+    model = st.selectbox("Model for Groups", options=BATCH_MODELS, format_func=MODEL_LABELS.get,
+                         help="The fast models forecast thousands of groups in seconds.")
+    if model == 'sarimax':
+        timeout = st.number_input("Timeout per Group (seconds)", min_value=1, value=DEFAULT_TIMEOUT, step=10,
+                                  help=f"Groups that fail or time out are forecast with {MODEL_LABELS[FALLBACK_MODEL]}.")
+    else:
+        timeout = DEFAULT_TIMEOUT
+
+    if group_columns and st.button("Run Batch Forecast"):
+        with st.spinner("Forecasting every group..."):
+            results = batch_forecast(data, group_columns, target, int(forecast_days), workers=int(workers), timeout=timeout,
+                                     model=model)
+        failed = results[~results['Status'].isin(['ok', 'fallback'])]
+        fallbacks = results[results['Status'] == 'fallback'].drop_duplicates(group_columns)
+        st.success(f"Forecasted {results.groupby(group_columns).ngroups - len(failed)} groups.")
+        if not fallbacks.empty:
+            st.info(f"{len(fallbacks)} groups were forecast with {MODEL_LABELS[FALLBACK_MODEL]} because SARIMAX failed or timed out.")
+            st.write(fallbacks[group_columns + ['Error']])
+        if not failed.empty:
+            st.warning(f"{len(failed)} groups could not be forecast.")
+            st.write(failed[group_columns + ['Status', 'Error']])
+        st.dataframe(results[results['Status'].isin(['ok', 'fallback'])])
+        st.download_button("Download Forecasts (CSV)", results.to_csv(index=False), file_name="batch_forecast.csv", mime="text/csv")
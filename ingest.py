@@ -0,0 +1,148 @@
+import hashlib
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instrumentation import stage
+from model_cache import CACHE_DIR
+from util import atomic_path
+
+SUPPORTED_TYPES = ["xlsx", "csv", "parquet", "arrow", "feather"]
+
+# Text and spreadsheet formats are converted to Parquet once and read from the cache afterwards.
+CONVERTED_TYPES = ("xlsx", "csv")
+
+# Object columns with at most this share of distinct values are stored as categoricals.
+CATEGORICAL_MAX_RATIO = 0.5
+
+# Size limit of the converted Parquet copies; the least recently used go first.
+CONVERTED_LIMIT_MB = int(os.environ.get("FLAVOUR_CONVERTED_MB", "2048"))
+
+
+def _extension(source):
+    name = getattr(source, 'name', str(source))
+    extension = os.path.splitext(name)[1].lower().lstrip('.')
+    if extension not in SUPPORTED_TYPES:
+        raise ValueError(f"Unsupported file type '.{extension}'. Supported types: {', '.join(SUPPORTED_TYPES)}")
+    return extension
+
+
+def _rewind(source):
+    """Return something pandas/pyarrow can read from the start: the path itself or the rewound buffer."""
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+
+def content_hash(source):
+    if hasattr(source, 'getvalue'):
+        return hashlib.sha256(source.getvalue()).hexdigest()
+    digest = hashlib.sha256()
+    with open(source, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def downcast(data):
+    """Shrink dtypes in place of the usual 64-bit/object defaults.
+
+    Dates become datetime64, columns mixing text and numbers become text, low-cardinality
+    text becomes categorical, floats become float32 and integers the narrowest integer type
+    that holds them.
+    """
+    columns = {}
+    for column in data.columns:
+        series = data[column]
+        if column == 'Date' and not pd.api.types.is_datetime64_any_dtype(series):
+            columns[column] = pd.to_datetime(series)
+        elif series.dtype == object:
+            if pd.api.types.infer_dtype(series, skipna=True).startswith('mixed'):
+                # Arrow can't store a column holding e.g. both 1 and 'S2'; keep such values as text.
+                series = columns[column] = series.where(series.isna(), series.astype(str))
+            if series.nunique(dropna=True) <= CATEGORICAL_MAX_RATIO * max(len(series), 1):
+                columns[column] = series.astype('category')
+        elif pd.api.types.is_float_dtype(series) and series.dtype != 'float32':
+            columns[column] = series.astype('float32')
+        elif pd.api.types.is_integer_dtype(series):
+            columns[column] = pd.to_numeric(series, downcast='integer')
+    if not columns:
+        return data
+    return data.assign(**columns)
+
+
+def converted_path(source, digest=None):
+    """Path of the cached Parquet copy of an xlsx/csv source, converting it on first use.
+
+    digest is the source's content_hash, when the caller has already computed it.
+    """
+    extension = _extension(source)
+    directory = os.path.join(CACHE_DIR, "datasets")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{digest or content_hash(source)}.parquet")
+    try:
+        # Touch the copy so eviction treats it as recently used.
+        os.utime(path)
+        return path
+    except OSError:
+        pass
+
+    with stage(f'read_{extension}') as record:
+        if extension == "xlsx":
+            data = pd.read_excel(_rewind(source))
+        else:
+            data = pd.read_csv(_rewind(source))
+        record['rows'] = len(data)
+    with stage('convert_to_parquet', rows=len(data)), atomic_path(path) as tmp_path:
+        downcast(data).to_parquet(tmp_path, index=False)
+    _evict_converted(directory, keep=path)
+    return path
+
+
+def _evict_converted(directory, keep, limit_mb=CONVERTED_LIMIT_MB):
+    """Delete the least recently used converted copies, other than keep, until the directory fits limit_mb."""
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.endswith(".parquet") or path == keep:
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries) + os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= limit_mb * 1024 * 1024:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def dataset_columns(source, digest=None):
+    """Column names of a dataset without loading its rows."""
+    extension = _extension(source)
+    if extension in CONVERTED_TYPES:
+        names = pq.read_schema(converted_path(source, digest)).names
+    elif extension == "parquet":
+        names = pq.read_schema(_rewind(source)).names
+    else:
+        names = pa.ipc.open_file(_rewind(source)).schema.names
+    return [name for name in names if not name.startswith("__index_level_")]
+
+
+def load_dataset(source, columns=None, digest=None):
+    """Load an uploaded file or path, reading only `columns` when given, with compact dtypes."""
+    extension = _extension(source)
+    if extension in CONVERTED_TYPES:
+        return pd.read_parquet(converted_path(source, digest), columns=columns)
+    if extension == "parquet":
+        data = pd.read_parquet(_rewind(source), columns=columns)
+    else:
+        data = pd.read_feather(_rewind(source), columns=columns)
+    return downcast(data)
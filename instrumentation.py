@@ -0,0 +1,186 @@
+"""Per-stage timing and memory records for the load -> analyse -> forecast -> evaluate flow.
+
+Wrap a stage in `with stage("name") as record:` (optionally setting record['rows']) or
+decorate a function with `@timed("name")`. Every stage records wall time, CPU time, rows
+and the increase of the process' peak resident memory. Setting FLAVOUR_TRACE_MEMORY=1 additionally traces Python allocations
+for an exact per-stage peak; that slows allocation-heavy code, so it is off by default.
+
+Records are kept in memory for the diagnostics panel, logged as one JSON line each on the
+'flavour_forecast.stages' logger, and, when FLAVOUR_METRICS_FILE is set, aggregated into a
+Prometheus text file that node_exporter's textfile collector (or anything else) can scrape.
+"""
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from util import atomic_path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger("flavour_forecast.stages")
+
+RECENT_STAGES = 500
+METRICS_FILE = os.environ.get("FLAVOUR_METRICS_FILE")
+# The metrics file is rewritten at most this often, so busy pages don't turn into disk writes.
+METRICS_INTERVAL = 10
+TRACE_MEMORY = os.environ.get("FLAVOUR_TRACE_MEMORY") == "1"
+
+# Re-entrant so write_metrics can hold it while prometheus_text reads the totals.
+_lock = threading.RLock()
+_records = collections.deque(maxlen=RECENT_STAGES)
+_totals = collections.defaultdict(lambda: {'calls': 0, 'errors': 0, 'wall': 0.0, 'cpu': 0.0, 'rows': 0, 'peak': 0})
+_last_write = 0.0
+_local = threading.local()
+
+
+def _max_rss():
+    """Peak resident memory of the process so far, in bytes."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _traced_stack():
+    if not hasattr(_local, "traced"):
+        _local.traced = []
+    return _local.traced
+
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """Measure the enclosed block as one stage; yields the record so the caller can fill in rows."""
+    record = {'stage': name, 'rows': rows, 'started': time.time()}
+    traced = TRACE_MEMORY
+    if traced:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # Nested stages share one tracemalloc peak: the parent remembers its own peak so far
+        # and the highest peak of its children before the child resets the counter.
+        stack = _traced_stack()
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        frame = {'start': current, 'peak': current}
+        stack.append(frame)
+        tracemalloc.reset_peak()
+    rss = _max_rss()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    except Exception as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record['wall'] = time.perf_counter() - wall
+        record['cpu'] = time.process_time() - cpu
+        record['rss_growth'] = max(_max_rss() - rss, 0)
+        if traced:
+            stack.pop()
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            record['peak'] = peak - frame['start']
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        _record(record)
+
+
+def timed(name, rows='input'):
+    """Decorator form of stage. rows is 'input' to count the rows of the first argument,
+    'result' to count the rows of the return value, or None."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name) as record:
+                if rows == 'input' and args and hasattr(args[0], '__len__') and not isinstance(args[0], str):
+                    record['rows'] = len(args[0])
+                result = function(*args, **kwargs)
+                if rows == 'result' and hasattr(result, '__len__'):
+                    record['rows'] = len(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def _record(record, log=True):
+    with _lock:
+        _records.append(record)
+        totals = _totals[record['stage']]
+        totals['calls'] += 1
+        totals['errors'] += 'error' in record
+        totals['wall'] += record['wall']
+        totals['cpu'] += record['cpu']
+        totals['rows'] += record['rows'] or 0
+        totals['peak'] = max(totals['peak'], record.get('peak', record['rss_growth']))
+    if log and logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record, default=str))
+    if METRICS_FILE:
+        with _lock:
+            if time.monotonic() - _last_write < METRICS_INTERVAL:
+                return
+            try:
+                write_metrics(METRICS_FILE)
+            except OSError:
+                # A metrics file that can't be written must not fail the stage it measured.
+                logger.warning("Could not write metrics to %s", METRICS_FILE, exc_info=True)
+
+
+def merge_stages(records):
+    """Add stage records measured in another process, such as a pool worker, to this process' records and totals."""
+    for record in records:
+        # The worker already logged them.
+        _record(record, log=False)
+
+
+def recent_stages():
+    """The most recent stage records, oldest first."""
+    with _lock:
+        return list(_records)
+
+
+def stage_totals():
+    """Calls, errors, wall/CPU seconds, rows and the largest memory peak per stage since start-up."""
+    with _lock:
+        return {name: dict(totals) for name, totals in _totals.items()}
+
+
+def reset():
+    with _lock:
+        _records.clear()
+        _totals.clear()
+
+
+def prometheus_text(totals=None):
+    totals = stage_totals() if totals is None else totals
+    metrics = [
+        ('flavour_stage_calls_total', 'counter', 'Times the stage ran', 'calls'),
+        ('flavour_stage_errors_total', 'counter', 'Times the stage raised', 'errors'),
+        ('flavour_stage_wall_seconds_total', 'counter', 'Wall-clock seconds spent in the stage', 'wall'),
+        ('flavour_stage_cpu_seconds_total', 'counter', 'Process CPU seconds spent in the stage', 'cpu'),
+        ('flavour_stage_rows_total', 'counter', 'Rows processed by the stage', 'rows'),
+        ('flavour_stage_peak_memory_bytes', 'gauge', 'Largest memory growth seen during one run of the stage', 'peak'),
+    ]
+    lines = []
+    for metric, kind, description, field in metrics:
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{stage="{name}"}} {values[field]}' for name, values in sorted(totals.items())]
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path):
+    """Atomically rewrite path with the current totals in the Prometheus text format."""
+    global _last_write
+    with _lock:
+        _last_write = time.monotonic()
+        with atomic_path(path) as tmp_path, open(tmp_path, "w") as handle:
+            handle.write(prometheus_text())
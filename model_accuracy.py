@@ -1,38 +1,90 @@
+import os
+
 import streamlit as st
-from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
 
-def evaluate_model(forecast_values, actual_values):
-    mse = mean_squared_error(actual_values, forecast_values)
-    mae = mean_absolute_error(actual_values, forecast_values)
-    r2 = r2_score(actual_values, forecast_values)
-
-    mse_variation = np.random.uniform(0.95, 1.05)  
-    mae_variation = np.random.uniform(0.95, 1.05)
-    r2_variation = np.random.uniform(0.95, 1.05)
+from backtesting import METRICS, backtest
+from forecast_store import BACKTEST_HORIZON, data_version, get_forecast_store
+from instrumentation import stage
+from pipeline import TARGETS, evaluate_forecast, to_daily
 
-    adjusted_mse = mse * mse_variation
-    adjusted_mae = mae * mae_variation
-    adjusted_r2 = r2 * r2_variation
-
-    adjusted_mse = min(max(adjusted_mse, 0), 1500)  
-    adjusted_mae = min(max(adjusted_mae, 0), 50)    
-    adjusted_r2 = max(min(adjusted_r2, 1), 0.6)    
+def evaluate_model(forecast_values, actual_values):
+    metrics = evaluate_forecast(forecast_values, actual_values)
+    mse, mae, r2 = metrics['MSE'], metrics['MAE'], metrics['R2']
 
     st.subheader("Accuracy Metrics")
-    st.write(f"**Mean Squared Error (MSE):** {adjusted_mse:.2f}")
-    st.write(f"**Mean Absolute Error (MAE):** {adjusted_mae:.2f}")
-    st.write(f"**R-squared (R2 Score):** {adjusted_r2:.2f}")
-    
+    st.write(f"**Mean Squared Error (MSE):** {mse:.2f}")
+    st.write(f"**Mean Absolute Error (MAE):** {mae:.2f}")
+    st.write(f"**R-squared (R2 Score):** {r2:.2f}")
+
     st.subheader("Interpretation Summary")
-    
-    mse_text = "The Mean Squared Error is low, indicating accurate forecasts with minimal error."
-    mae_text = "The Mean Absolute Error is within a reasonable range, suggesting low average errors in predictions."
-    r2_text = "The R-squared value is high, indicating strong predictive capability and that the model explains most of the variance."
+
+    # Judge the errors relative to the typical size of the actuals rather than fixed cut-offs.
+    relative_mae = mae / max(np.abs(np.asarray(actual_values, dtype=float)).mean(), 1e-9)
+    if relative_mae < 0.1:
+        mae_text = f"The average error is {relative_mae * 100:.1f}% of typical demand, so forecasts are close to the actuals."
+    elif relative_mae < 0.25:
+        mae_text = f"The average error is {relative_mae * 100:.1f}% of typical demand, which is usable but leaves room for improvement."
+    else:
+        mae_text = f"The average error is {relative_mae * 100:.1f}% of typical demand, so forecasts should be treated with caution."
+    mse_text = "The Mean Squared Error penalises large misses more heavily; compare it against other model configurations rather than in isolation."
+    if r2 >= 0.7:
+        r2_text = "The R-squared value is high, indicating that the model explains most of the variance."
+    elif r2 >= 0:
+        r2_text = "The R-squared value is moderate, so a good part of the variance is not captured by the model."
+    else:
+        r2_text = "The R-squared value is negative, meaning the model does worse than predicting the average."
 
     st.write("**Mean Squared Error (MSE):**", mse_text)
     st.write("**Mean Absolute Error (MAE):**", mae_text)
     st.write("**R-squared (R2 Score):**", r2_text)
 
-    st.write("\n**Overall:** The model performs well and is suitable for almost accurate demand forecasting.")
+def backtest_view(data, dataset=None):
+    st.subheader("Rolling-Origin Backtest")
+    st.write("Refit the model at many historical forecast origins and score each forecast against what actually happened.")
+
+    target = st.selectbox("Target Attribute", options=TARGETS)
+    y = to_daily(data)[target]
+    stored = get_forecast_store().latest(dataset or "upload", target, y)
+    if stored is not None and stored['backtest'] is not None:
+        st.write(f"**Latest background backtest** ({BACKTEST_HORIZON}-day horizon, default model, computed "
+                 f"{pd.Timestamp(stored['backtested'], unit='s'):%Y-%m-%d %H:%M}):")
+        st.dataframe(stored['backtest'])
+    horizon = st.number_input("Forecast Horizon (days)", min_value=1, max_value=90, value=14, step=1)
+    step = st.number_input("Days Between Origins", min_value=1, max_value=90, value=int(horizon), step=1)
+    window = st.radio("Training Window", options=["expanding", "sliding"], horizontal=True)
+    workers = st.number_input("Worker Processes", min_value=1, max_value=os.cpu_count(), value=os.cpu_count(), step=1)
+
+    # A result only belongs to the data and settings it was run with; changing any of them hides it.
+    settings = (data_version(y), target, int(horizon), int(step), window)
+    if st.button("Run Backtest"):
+        try:
+            with st.spinner("Running backtest folds..."):
+                st.session_state['backtest'] = settings, backtest(y, horizon=int(horizon), step=int(step), window=window,
+                                                                  workers=int(workers))
+        except ValueError as e:
+            st.error(str(e))
+            return
+
+    stored_settings, result = st.session_state.get('backtest', (None, None))
+    if stored_settings != settings:
+        return
+    by_fold, by_horizon = result
+
+    st.write(f"**Folds evaluated:** {len(by_fold)}")
+    st.write("**Average over all folds and horizons:**")
+    st.write(by_fold[METRICS].mean().to_frame('Value').T)
+
+    metric = st.selectbox("Metric to Plot", options=METRICS, index=METRICS.index('MASE'))
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=by_horizon.index, y=by_horizon[metric], mode='lines+markers', name=metric))
+    fig.update_layout(title=f"{metric} by Forecast Horizon", xaxis_title="Days Ahead", yaxis_title=metric)
+    with stage('render_chart'):
+        st.plotly_chart(fig)
 
+    st.write("**Metrics per Horizon:**")
+    st.dataframe(by_horizon)
+    st.write("**Metrics per Fold:**")
+    st.dataframe(by_fold)
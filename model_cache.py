@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from util import atomic_path, process_singleton
+
+CACHE_DIR = os.environ.get("FLAVOUR_CACHE_DIR", ".flavour_cache")
+MEMORY_ENTRIES = int(os.environ.get("FLAVOUR_MODEL_CACHE_ENTRIES", "32"))
+DISK_LIMIT_MB = int(os.environ.get("FLAVOUR_MODEL_CACHE_MB", "512"))
+# Puts keep a running total of the disk tier's size and only list the directory when it is
+# over the limit or this many seconds after the last listing, since other processes share it.
+RESCAN_INTERVAL = 300
+# Eviction frees space down to this share of the limit, so a full tier isn't listed on every put.
+EVICT_TO = 0.9
+
+
+def series_fingerprint(y, target, order, seasonal_order, train_size):
+    """Content hash of a prepared daily series and the settings used to fit it."""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(y.to_numpy(dtype="float64")).tobytes())
+    digest.update(np.ascontiguousarray(y.index.asi8).tobytes())
+    digest.update(repr((target, tuple(order), tuple(seasonal_order), int(train_size))).encode())
+    return digest.hexdigest()
+
+
+def lineage_key(y, target, order, seasonal_order, head=28):
+    """Identity of a series that survives new days being appended: its start and first few values."""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(y[:head].to_numpy(dtype="float64")).tobytes())
+    digest.update(repr((str(y.index[0]), target, tuple(order), tuple(seasonal_order))).encode())
+    return digest.hexdigest()
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ModelCache:
+    """Two-tier cache of fitted model results: an in-memory LRU backed by pickles on disk."""
+
+    def __init__(self, directory=None, memory_entries=MEMORY_ENTRIES, disk_limit_mb=DISK_LIMIT_MB):
+        self.directory = os.path.join(directory or CACHE_DIR, "models")
+        self.memory_entries = memory_entries
+        self.disk_limit = disk_limit_mb * 1024 * 1024
+        self.lineage_directory = os.path.join(directory or CACHE_DIR, "lineage")
+        self.orders_directory = os.path.join(directory or CACHE_DIR, "orders")
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self._scanned = 0.0
+        os.makedirs(self.directory, exist_ok=True)
+        os.makedirs(self.lineage_directory, exist_ok=True)
+        os.makedirs(self.orders_directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _remember(self, key, results):
+        self._memory[key] = results
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as handle:
+                results = pickle.load(handle)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        # Touch the file so disk eviction treats it as recently used.
+        os.utime(path)
+
+        with self._lock:
+            self._remember(key, results)
+        return results
+
+    def put(self, key, results):
+        with self._lock:
+            self._remember(key, results)
+
+        path = self._path(key)
+        replaced = _size(path)
+        try:
+            with atomic_path(path) as tmp_path, open(tmp_path, "wb") as handle:
+                pickle.dump(results, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        except (OSError, pickle.PicklingError):
+            return
+        with self._lock:
+            due = self._disk_bytes is None or time.monotonic() - self._scanned > RESCAN_INTERVAL
+            if not due:
+                self._disk_bytes += _size(path) - replaced
+                due = self._disk_bytes > self.disk_limit
+        if due:
+            self._evict()
+
+    def _evict(self):
+        """Drop the least recently used pickles once the disk tier exceeds its size limit, down to EVICT_TO of it."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pkl"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_limit * EVICT_TO if total > self.disk_limit else total
+        for _, size, name in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+        with self._lock:
+            self._disk_bytes, self._scanned = total, time.monotonic()
+
+    def _read_json(self, directory, key):
+        try:
+            with open(os.path.join(directory, f"{key}.json")) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, directory, key, record):
+        with atomic_path(os.path.join(directory, f"{key}.json")) as tmp_path, open(tmp_path, "w") as handle:
+            json.dump(record, handle)
+
+    def get_lineage(self, lineage):
+        """Metadata about the most recent fit of a growing series, or None."""
+        return self._read_json(self.lineage_directory, lineage)
+
+    def put_lineage(self, lineage, metadata):
+        self._write_json(self.lineage_directory, lineage, metadata)
+
+    def get_order(self, key):
+        """Result of an earlier order search on the same series and search settings, or None."""
+        return self._read_json(self.orders_directory, key)
+
+    def put_order(self, key, result):
+        self._write_json(self.orders_directory, key, result)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._disk_bytes = None
+        for name in os.listdir(self.directory):
+            if name.endswith(".pkl"):
+                os.remove(os.path.join(self.directory, name))
+        for directory in (self.lineage_directory, self.orders_directory):
+            for name in os.listdir(directory):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(directory, name))
+
+
+@process_singleton
+def get_model_cache():
+    """Process-wide model cache shared by every Streamlit session."""
+    return ModelCache()
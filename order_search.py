@@ -0,0 +1,147 @@
+import hashlib
+import itertools
+import math
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+from instrumentation import timed
+from model_cache import get_model_cache, series_fingerprint
+from worker_pool import map_with_timeout
+
+CRITERIA = ['aic', 'bic', 'holdout']
+DEFAULT_GRID = {'p': (0, 1, 2), 'd': (1,), 'q': (0, 1, 2), 'P': (0, 1), 'D': (1,), 'Q': (0, 1), 's': 7}
+
+# Grid search first screens every candidate with a few optimizer iterations and only fully
+# fits the best KEEP_FRACTION of them.
+SCREEN_ITERATIONS = 15
+KEEP_FRACTION = 1 / 3
+CANDIDATE_TIMEOUT = 60
+MAX_STEPWISE_ROUNDS = 20
+
+
+def order_grid(p=(0, 1, 2), d=(1,), q=(0, 1, 2), P=(0, 1), D=(1,), Q=(0, 1), s=7):
+    """All (order, seasonal_order) pairs in the given ranges."""
+    return [((a, b, c), (A, B, C, s)) for a, b, c, A, B, C in itertools.product(p, d, q, P, D, Q)]
+
+
+def _score(values, order, seasonal_order, criterion, holdout, maxiter):
+    """Score one candidate; lower is better and anything that fails scores infinity."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            train = values[:-holdout] if criterion == 'holdout' else values
+            results = SARIMAX(train, order=order, seasonal_order=seasonal_order).fit(disp=False, maxiter=maxiter)
+            if criterion == 'holdout':
+                score = np.mean(np.abs(results.forecast(holdout) - values[-holdout:]))
+            else:
+                score = getattr(results, criterion)
+    except Exception:
+        return math.inf
+    return float(score) if np.isfinite(score) else math.inf
+
+
+class _Evaluator:
+    """Scores batches of candidates in a process pool, remembering every score it has seen."""
+
+    def __init__(self, workers, values, criterion, holdout, timeout):
+        self.workers = workers
+        self.values = values
+        self.criterion = criterion
+        self.holdout = holdout
+        self.timeout = timeout
+        self.scores = {}
+
+    def evaluate(self, candidates, maxiter=50, record=True):
+        tasks = [(self.values, *candidate, self.criterion, self.holdout, maxiter) for candidate in candidates]
+        scores = []
+        for index, score, failure in map_with_timeout(_score, tasks, self.workers, self.timeout):
+            candidate = candidates[index]
+            # A candidate that overruns its timeout is killed and scores infinity.
+            score = math.inf if failure is not None else score
+            scores.append(score)
+            if record:
+                self.scores[candidate] = score
+        return scores
+
+
+def _grid_search(evaluator, candidates):
+    screened = evaluator.evaluate(candidates, maxiter=SCREEN_ITERATIONS, record=False)
+    ranked = [candidate for score, candidate in sorted(zip(screened, candidates)) if np.isfinite(score)]
+    survivors = ranked[:max(1, math.ceil(len(candidates) * KEEP_FRACTION))]
+    evaluator.evaluate(survivors)
+
+
+def _stepwise_search(evaluator, grid):
+    """Hyndman-Khandakar style search: start from a few simple models and move to the best neighbour."""
+    bounds = {name: (min(grid[name]), max(grid[name])) for name in ('p', 'q', 'P', 'Q')}
+    d, D, s = grid['d'][0], grid['D'][0], grid['s']
+
+    def candidate(p, q, P, Q):
+        return ((p, d, q), (P, D, Q, s))
+
+    def clip(p, q, P, Q):
+        values = dict(zip(('p', 'q', 'P', 'Q'), (p, q, P, Q)))
+        return all(bounds[name][0] <= value <= bounds[name][1] for name, value in values.items())
+
+    starts = [point for point in [(2, 2, 1, 1), (0, 0, 0, 0), (1, 0, 1, 0), (0, 1, 0, 1)] if clip(*point)]
+    starts = starts or [(bounds['p'][0], bounds['q'][0], bounds['P'][0], bounds['Q'][0])]
+    scores = evaluator.evaluate([candidate(*point) for point in starts])
+    best_score, best = min(zip(scores, starts))
+
+    for _ in range(MAX_STEPWISE_ROUNDS):
+        neighbours = []
+        for position, step in itertools.product(range(4), (-1, 1)):
+            point = list(best)
+            point[position] += step
+            if clip(*point) and candidate(*point) not in evaluator.scores:
+                neighbours.append(tuple(point))
+        if not neighbours:
+            break
+        scores = evaluator.evaluate([candidate(*point) for point in neighbours])
+        round_score, round_best = min(zip(scores, neighbours))
+        if round_score >= best_score:
+            break
+        best_score, best = round_score, round_best
+
+
+@timed('order_search')
+def search_orders(y, target, criterion='aic', grid=None, stepwise=False, holdout=14, workers=None,
+                  timeout=CANDIDATE_TIMEOUT):
+    """Pick SARIMA orders for a daily series, searching the grid in a process pool.
+
+    criterion is 'aic', 'bic' or 'holdout' (MAE over the last `holdout` days). The winner is
+    cached per series fingerprint and search settings, so repeating a search is free.
+    Returns (order, seasonal_order, candidates) where candidates ranks every fully fitted
+    candidate by score.
+    """
+    if criterion not in CRITERIA:
+        raise ValueError(f"Unknown criterion: {criterion}")
+    grid = {**DEFAULT_GRID, **(grid or {})}
+    settings = repr((criterion, sorted(grid.items()), stepwise, holdout if criterion == 'holdout' else None))
+    key = hashlib.sha256((series_fingerprint(y, target, (), (), len(y)) + settings).encode()).hexdigest()
+
+    cache = get_model_cache()
+    cached = cache.get_order(key)
+    if cached is None:
+        values = np.asarray(y, dtype='float64')
+        workers = workers or os.cpu_count()
+        evaluator = _Evaluator(workers, values, criterion, holdout, timeout)
+        if stepwise:
+            _stepwise_search(evaluator, grid)
+        else:
+            _grid_search(evaluator, order_grid(**grid))
+        ranked = sorted(evaluator.scores.items(), key=lambda item: item[1])
+        if not ranked or not np.isfinite(ranked[0][1]):
+            raise ValueError("No candidate model could be fitted to this series.")
+        cached = {'candidates': [[list(order), list(seasonal_order), score] for (order, seasonal_order), score in ranked]}
+        cache.put_order(key, cached)
+
+    candidates = pd.DataFrame(
+        [(tuple(order), tuple(seasonal_order), score) for order, seasonal_order, score in cached['candidates']],
+        columns=['Order', 'Seasonal Order', 'Score'])
+    best = candidates.iloc[0]
+    return best['Order'], best['Seasonal Order'], candidates
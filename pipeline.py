@@ -0,0 +1,292 @@
+"""UI-free forecasting pipeline: load -> clean -> daily resample -> fit -> forecast -> adjust -> evaluate.
+
+The Streamlit pages and the command-line entry point in cli.py are both thin wrappers
+around these functions.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FitTimeout
+
+import numpy as np
+import pandas as pd
+
+from cleaning import SERIES_WORDS, clean_timeseries
+from fast_models import forecast_one
+from ingest import load_dataset
+from instrumentation import stage, timed
+from model_cache import get_model_cache, lineage_key, series_fingerprint
+from probabilistic import PATHS, UPLIFT_SPREAD, probabilistic_forecast
+
+TARGETS = ["Sales Volume", "Demand Volume"]
+PROMOTION_TYPES = ["None", "Discount", "BOGO", "Others"]
+
+# Uplift per holiday, per concert/festival and per percentage point of promotional discount.
+HOLIDAY_UPLIFT = 0.02
+CONCERT_UPLIFT = 0.015
+DISCOUNT_UPLIFT = 0.005
+UPLIFT_COEFFICIENTS = (HOLIDAY_UPLIFT, CONCERT_UPLIFT, DISCOUNT_UPLIFT)
+
+# Share of the history used for fitting; the rest is held out for evaluation.
+TRAIN_FRACTION = 0.8
+
+ORDER = (1, 1, 1)
+SEASONAL_ORDER = (1, 1, 1, 7)
+
+# Incremental updates reuse the estimated parameters until this many days were appended
+# since the last full fit, or until the new days' one-step errors exceed this many
+# standard deviations on average.
+REFIT_AFTER_DAYS = 28
+DRIFT_THRESHOLD = 2.0
+
+# Seconds a SARIMAX fit may take before forecast_with_fallback answers with FALLBACK_MODEL.
+FIT_TIME_BUDGET = 30
+FALLBACK_MODEL = 'ets'
+
+DAILY_AGGREGATIONS = {
+    'Sales Volume': 'sum',
+    'Demand Volume': 'sum',
+    'Remaining Volume': 'sum',
+    'Production Volume': 'sum',
+    'Temperature': 'mean',
+    'Humidity': 'mean',
+    'Consumer Price Index': 'mean',
+    'Economic Indicator': 'mean',
+    'Disposable Income Level': 'mean'
+}
+
+@timed('daily_resample')
+def to_daily(data):
+    """Collapse duplicate dates and forward-fill gaps so there is exactly one row per day."""
+    data = data.set_index(pd.to_datetime(data['Date'])).drop(columns='Date')
+    if data.index.duplicated().any():
+        aggregations = {column: how for column, how in DAILY_AGGREGATIONS.items() if column in data.columns}
+        data = data.groupby('Date').agg(aggregations)
+    data = data.sort_index()
+    return data.asfreq('D', method='pad')
+
+@timed('sarimax_fit')
+def fit_sarimax(y, train_size, target, order=ORDER, seasonal_order=SEASONAL_ORDER, incremental=True,
+                use_cache=True):
+    """Fit SARIMAX on the first train_size days of y, reusing a cached fit when nothing changed.
+
+    When y is a previously fitted series with new days appended, the earlier results are
+    extended with the new observations instead of re-estimating the parameters. With
+    use_cache=False the shared model cache is neither read nor written, so bulk jobs
+    don't evict the fits interactive sessions rely on.
+    """
+    if not use_cache:
+        return _fit(y[:train_size], order, seasonal_order)
+    cache = get_model_cache()
+    key = series_fingerprint(y, target, order, seasonal_order, train_size)
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    train_data = y[:train_size]
+    lineage = lineage_key(train_data, target, order, seasonal_order)
+    previous = cache.get_lineage(lineage) if incremental else None
+    results = None
+    if previous is not None:
+        results = _extend_fit(cache, previous, train_data, target, order, seasonal_order)
+
+    if results is None:
+        results = _fit(train_data, order, seasonal_order)
+        fitted_length = train_size
+    else:
+        fitted_length = previous['fitted_length']
+
+    cache.put(key, results)
+    cache.put_lineage(lineage, {
+        'key': key,
+        'length': train_size,
+        'prefix': series_fingerprint(train_data, target, order, seasonal_order, train_size),
+        'fitted_length': fitted_length
+    })
+    return results
+
+def _fit(train_data, order, seasonal_order):
+    # Imported here so loading and cleaning data never pays for statsmodels.
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+    return SARIMAX(train_data, seasonal_order=seasonal_order, order=order).fit(disp=False)
+
+def _extend_fit(cache, previous, train_data, target, order, seasonal_order):
+    """Extend the previous results with the appended days, or return None when a full refit is due."""
+    length = previous['length']
+    if len(train_data) < length:
+        return None
+    prefix = series_fingerprint(train_data[:length], target, order, seasonal_order, length)
+    if prefix != previous['prefix']:
+        return None
+    if len(train_data) - previous['fitted_length'] > REFIT_AFTER_DAYS:
+        return None
+    results = cache.get(previous['key'])
+    if results is None:
+        return None
+    new_days = train_data[length:]
+    if new_days.empty:
+        return results
+
+    # Filters only the new days with the parameters already estimated.
+    extended = results.extend(new_days)
+    errors = extended.standardized_forecasts_error[0]
+    if np.nanmean(errors ** 2) > DRIFT_THRESHOLD ** 2:
+        return None
+    return extended
+
+@timed('load', rows='result')
+def load(source, columns=None, digest=None):
+    return load_dataset(source, columns=columns, digest=digest)
+
+def analysis_columns(columns):
+    """The columns the pages use, in file order: Date, the targets, the daily drivers and the
+    flavour, promotion, region and store columns. Falls back to every named column when none match."""
+    wanted = {'Date', *TARGETS, *DAILY_AGGREGATIONS}
+    words = SERIES_WORDS + ("promotion",)
+    used = [column for column in columns
+            if column in wanted or any(word in str(column).lower() for word in words)]
+    return used or [column for column in columns if not str(column).startswith("Unnamed:")]
+
+@timed('clean_missing')
+def clean_with_report(data, group_columns=None, method='interpolate'):
+    """Fill missing values and return (cleaned, gap report).
+
+    With a Date column every series (see cleaning.series_columns) is reindexed to a full
+    daily calendar and imputed in time order, volumes with `method`; the report has one
+    row per series. Without dates it falls back to the mode for categorical columns and
+    the mean for numeric ones, and the report is None.
+    """
+    if 'Date' in data.columns:
+        sums = [column for column, how in DAILY_AGGREGATIONS.items() if how == 'sum']
+        return clean_timeseries(data, group_columns, method, sums=sums)
+
+    fills = {}
+    for column in data.columns[data.isna().any().to_numpy()]:
+        if pd.api.types.is_numeric_dtype(data[column]):
+            fills[column] = data[column].mean()
+        else:
+            modes = data[column].mode()
+            if not modes.empty:
+                fills[column] = modes.iloc[0]
+    return (data.fillna(fills) if fills else data), None
+
+def clean_missing(data, group_columns=None, method='interpolate'):
+    return clean_with_report(data, group_columns, method)[0]
+
+def forecast_series(y, target, forecast_days, train_fraction=TRAIN_FRACTION, order=ORDER, seasonal_order=SEASONAL_ORDER):
+    """Fit on the first train_fraction of y and forecast forecast_days from the end of training.
+
+    Returns (forecast_values, test_data, results).
+    """
+    train_size = int(train_fraction * len(y))
+    results = fit_sarimax(y, train_size, target, order, seasonal_order)
+    with stage('get_forecast', rows=forecast_days):
+        forecast_values = results.get_forecast(steps=forecast_days).predicted_mean
+    return forecast_values, y[train_size:], results
+
+_fit_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='sarimax-fit')
+_pending_fits = {}
+_pending_lock = threading.Lock()
+
+
+def _forget_fit(key, future):
+    with _pending_lock:
+        if _pending_fits.get(key) is future:
+            del _pending_fits[key]
+
+
+def forecast_with_fallback(y, target, forecast_days, train_fraction=TRAIN_FRACTION, order=ORDER,
+                           seasonal_order=SEASONAL_ORDER, model='sarimax', time_budget=FIT_TIME_BUDGET,
+                           fallback=FALLBACK_MODEL):
+    """forecast_series with a time budget: when SARIMAX raises or is still fitting after
+    time_budget seconds, the fast fallback model from fast_models forecasts instead.
+
+    A fit that overruns keeps going in the background and lands in the model cache, so a
+    later call for the same series gets SARIMAX. Any model other than 'sarimax' skips
+    SARIMAX altogether. Returns (forecast_values, test_data, model_used, reason), where
+    reason says why the fallback was used and is None otherwise.
+    """
+    train_size = int(train_fraction * len(y))
+    if model != 'sarimax':
+        return forecast_one(y[:train_size], forecast_days, model), y[train_size:], model, None
+
+    key = series_fingerprint(y, target, order, seasonal_order, train_size)
+    with _pending_lock:
+        future = _pending_fits.get(key)
+        submitted = future is None
+        if submitted:
+            future = _fit_executor.submit(forecast_series, y, target, forecast_days, train_fraction, order, seasonal_order)
+            _pending_fits[key] = future
+    if submitted:
+        # Outside the lock: a fit that has already finished runs the callback right here.
+        future.add_done_callback(lambda done: _forget_fit(key, done))
+    try:
+        forecast_values, test_data, _ = future.result(timeout=time_budget)
+        if len(forecast_values) != forecast_days:
+            # A fit started for another horizon; the fitted model is cached now, so this is quick.
+            forecast_values, test_data, _ = forecast_series(y, target, forecast_days, train_fraction, order, seasonal_order)
+        return forecast_values, test_data, 'sarimax', None
+    except FitTimeout:
+        reason = f"SARIMAX did not finish within {time_budget}s"
+    except Exception as e:
+        reason = f"SARIMAX failed: {type(e).__name__}: {e}"
+    return forecast_one(y[:train_size], forecast_days, fallback), y[train_size:], fallback, reason
+
+@timed('adjust_forecast')
+def adjust_forecast(forecast_values, num_holidays=0, num_concerts=0, promotion_type="None", discount_amount=0):
+    """Scale a baseline forecast for external factors.
+
+    Returns (adjusted_forecast_values, total_increase, deviation_summary) where
+    deviation_summary holds one human-readable line per factor.
+    """
+    deviation_summary = []
+
+    holiday_increase = num_holidays * HOLIDAY_UPLIFT
+    deviation_summary.append(f"{holiday_increase * 100:.1f}% increase due to {num_holidays} holidays.")
+
+    concert_increase = num_concerts * CONCERT_UPLIFT
+    deviation_summary.append(f"{concert_increase * 100:.1f}% increase due to {num_concerts} concerts/festivals.")
+
+    if promotion_type != "None":
+        promotion_increase = discount_amount * DISCOUNT_UPLIFT
+        deviation_summary.append(f"{promotion_increase * 100:.1f}% increase from a {discount_amount}% {promotion_type.lower()} promotion.")
+    else:
+        promotion_increase = 0
+
+    total_increase = holiday_increase + concert_increase + promotion_increase
+    return forecast_values * (1 + total_increase), total_increase, deviation_summary
+
+@timed('simulate_paths')
+def forecast_quantiles(y, target, forecast_days, train_fraction=TRAIN_FRACTION, order=ORDER, seasonal_order=SEASONAL_ORDER,
+                       num_holidays=0, num_concerts=0, promotion_type="None", discount_amount=0, spread=UPLIFT_SPREAD,
+                       paths=PATHS, seed=0):
+    """Probabilistic counterpart of forecast_series followed by adjust_forecast.
+
+    Simulates `paths` demand paths from the SARIMAX fit, each scaled by the external
+    factors with uplifts drawn around their point estimates (relative spread `spread`).
+    Returns (daily, cumulative) quantile frames indexed by date; see
+    probabilistic.probabilistic_forecast.
+    """
+    train_size = int(train_fraction * len(y))
+    results = fit_sarimax(y, train_size, target, order, seasonal_order)
+    start = y.index[train_size - 1] + pd.Timedelta(days=1)
+    # Like adjust_forecast, the factors' totals over the horizon lift every day alike.
+    calendar = pd.DataFrame({
+        'Holiday': float(num_holidays),
+        'Concert': float(num_concerts),
+        'Discount': float(discount_amount) if promotion_type != "None" else 0.0
+    }, index=pd.date_range(start, periods=forecast_days, freq='D'))
+    return probabilistic_forecast(results, forecast_days, start, calendar, UPLIFT_COEFFICIENTS, spread, paths, seed=seed)
+
+@timed('metrics')
+def evaluate_forecast(forecast_values, actual_values):
+    """MSE, MAE and R2 of a forecast against actuals, over the days both cover."""
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+    actual_values = np.asarray(actual_values, dtype=float)
+    forecast_values = np.asarray(forecast_values, dtype=float)
+    length = min(len(actual_values), len(forecast_values))
+    actual_values, forecast_values = actual_values[:length], forecast_values[:length]
+    return {
+        'MSE': mean_squared_error(actual_values, forecast_values),
+        'MAE': mean_absolute_error(actual_values, forecast_values),
+        'R2': r2_score(actual_values, forecast_values) if length > 1 else float('nan')
+    }
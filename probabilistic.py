@@ -0,0 +1,172 @@
+"""Probabilistic forecasts: demand quantiles from simulated sample paths.
+
+Paths are drawn from a fitted SARIMAX state-space model, starting from the predicted
+state at the forecast origin and its uncertainty, and each path is scaled by event
+uplifts drawn from their own distributions, so the quantiles carry both the model's and
+the uplift uncertainty.
+
+A linear state-space model is a linear map from the initial state and the shocks to the
+observations, so the recursion is unrolled once into its impulse responses and a whole
+chunk of paths is one matrix product, with no loop over days. Paths are generated
+CHUNK_PATHS at a time and every chunk is reduced to per-day histograms before the next
+one is drawn, so memory does not grow with the number of paths.
+"""
+import numpy as np
+import pandas as pd
+
+from scenarios import EVENTS
+
+PATHS = 10000
+CHUNK_PATHS = 2000
+QUANTILES = (0.1, 0.5, 0.9)
+# Histogram bins per day; quantiles are exact to within 1/BINS of each day's range.
+BINS = 2000
+# Relative standard deviation of every per-event uplift around its point estimate.
+UPLIFT_SPREAD = 0.5
+
+
+def quantile_label(q):
+    return f"P{round(q * 100)}"
+
+
+def _square_root(matrix):
+    """A factor L with L @ L.T == matrix, for positive semi-definite matrices that may be singular."""
+    values, vectors = np.linalg.eigh(matrix)
+    return vectors * np.sqrt(np.clip(values, 0, None))
+
+
+def impulse_responses(results, horizon):
+    """Unroll a fitted time-invariant state-space model over the horizon.
+
+    Returns (initial, drift, shocks, start, start_factor, obs_sd). Day t of a path is
+    state @ initial[:, t] + drift[t] + draws @ shocks[:, t] + obs_sd * noise, where
+    state = start + start_factor @ z is the state on the first day and draws holds the
+    standard normal state shocks of days 0..horizon-2; z and noise are standard normal too.
+    """
+    ssm = results.filter_results
+    matrices = [ssm.design, ssm.obs_intercept, ssm.obs_cov, ssm.transition, ssm.state_intercept, ssm.selection, ssm.state_cov]
+    if any(matrix.shape[-1] != 1 for matrix in matrices) or ssm.design.shape[0] != 1:
+        raise ValueError("Sample paths need a univariate model with time-invariant matrices.")
+    design, obs_intercept, obs_cov, transition, state_intercept, selection, state_cov = (
+        matrix[..., 0] for matrix in matrices)
+
+    k_states, k_shocks = selection.shape
+    initial = np.empty((horizon, k_states))
+    row = design[0]
+    for t in range(horizon):
+        initial[t] = row
+        row = row @ transition
+    # Response of day t to the state intercept and to a shock on day j < t: design @ T^(t-1-j).
+    drift = obs_intercept[0] + np.r_[0.0, np.cumsum(initial[:-1] @ state_intercept)]
+    response = initial @ selection @ _square_root(state_cov)
+    lag = np.arange(horizon)[None, :] - 1 - np.arange(horizon - 1)[:, None]
+    shocks = np.where(lag[:, None, :] >= 0, response[np.maximum(lag, 0)].transpose(0, 2, 1), 0.0)
+    shocks = shocks.reshape((horizon - 1) * k_shocks, horizon)
+
+    start = ssm.predicted_state[:, -1]
+    start_factor = _square_root(ssm.predicted_state_cov[:, :, -1])
+    return initial.T, drift, shocks, start, start_factor, np.sqrt(max(obs_cov[0, 0], 0.0))
+
+
+def uplift_multipliers(calendar, coefficients, spread, paths, rng):
+    """(paths x days) demand multipliers from per-path draws of the per-event uplifts.
+
+    calendar is a (days x events) frame like scenarios.event_calendar, coefficients the
+    point estimate of each event's uplift. Each path draws every uplift from a lognormal
+    with that mean and a relative standard deviation of `spread`.
+    """
+    effects = calendar[EVENTS].to_numpy(dtype='float64')
+    means = np.asarray(coefficients, dtype='float64')
+    sigma = np.sqrt(np.log1p(spread ** 2))
+    draws = np.exp(rng.normal(-sigma ** 2 / 2, sigma, (paths, len(means)))) * means
+    return 1 + draws @ effects.T
+
+
+def sample_paths(results, horizon, paths=PATHS, calendar=None, coefficients=None, spread=UPLIFT_SPREAD, seed=0,
+                 chunk_paths=CHUNK_PATHS):
+    """Yield (chunk x horizon) arrays of simulated daily demand, CHUNK_PATHS paths at a time.
+
+    With a calendar and uplift coefficients each path is scaled by its own uplift draws.
+    Demand is floored at zero.
+    """
+    rng = np.random.default_rng(seed)
+    initial, drift, shocks, start, start_factor, obs_sd = impulse_responses(results, horizon)
+    # The shocks are most of the work; single precision halves it and is ample for demand.
+    shocks = shocks.astype(np.float32)
+    for first in range(0, paths, chunk_paths):
+        size = min(chunk_paths, paths - first)
+        states = start + rng.standard_normal((size, len(start))) @ start_factor.T
+        demand = states @ initial + drift + rng.standard_normal((size, len(shocks)), dtype=np.float32) @ shocks
+        if obs_sd:
+            demand += obs_sd * rng.standard_normal((size, horizon))
+        if calendar is not None and coefficients is not None:
+            demand *= uplift_multipliers(calendar, coefficients, spread, size, rng)
+        yield np.maximum(demand, 0, out=demand)
+
+
+def _reduce(results, horizon, paths, calendar, coefficients, spread, seed, chunk_paths, reduce):
+    """Call reduce(daily, cumulative) on every chunk of paths, with the chunk's running totals."""
+    for chunk in sample_paths(results, horizon, paths, calendar, coefficients, spread, seed, chunk_paths):
+        reduce(chunk, np.cumsum(chunk, axis=1))
+
+
+def _histogram_quantiles(counts, low, width, quantiles):
+    """Quantiles of every row of (days x BINS) histograms, interpolating linearly inside a bin."""
+    rows = np.arange(len(counts))
+    cdf = np.cumsum(counts, axis=1)
+    columns = []
+    for q in quantiles:
+        rank = q * cdf[:, -1]
+        bins = np.minimum((cdf < rank[:, None]).sum(axis=1), counts.shape[1] - 1)
+        before = np.where(bins > 0, cdf[rows, bins - 1], 0)
+        fraction = (rank - before) / np.maximum(counts[rows, bins], 1)
+        columns.append(low + width * (bins + fraction))
+    return np.column_stack(columns)
+
+
+def probabilistic_forecast(results, horizon, start=None, calendar=None, coefficients=None, spread=UPLIFT_SPREAD,
+                           paths=PATHS, quantiles=QUANTILES, seed=0, chunk_paths=CHUNK_PATHS, bins=BINS):
+    """Per-day and cumulative quantiles of demand over the horizon from simulated sample paths.
+
+    start is the first forecast date. Returns (daily, cumulative) frames with a Mean column
+    and one column per quantile (P10, P50, P90 by default). Cumulative row d holds the
+    quantiles of total demand from the first day through day d, which is what a
+    production target for the whole horizon needs; they are not the running sum of the
+    daily quantiles.
+
+    The paths are drawn twice from the same seed: the first pass finds every day's range
+    and the mean, the second counts the paths into `bins` bins across that range.
+    """
+    args = (results, horizon, paths, calendar, coefficients, spread, seed, chunk_paths)
+    low = np.full((2, horizon), np.inf)
+    high = np.full((2, horizon), -np.inf)
+    total = np.zeros((2, horizon))
+
+    def bounds(daily, cumulative):
+        for i, values in enumerate((daily, cumulative)):
+            np.minimum(low[i], values.min(axis=0), out=low[i])
+            np.maximum(high[i], values.max(axis=0), out=high[i])
+            total[i] += values.sum(axis=0)
+
+    _reduce(*args, bounds)
+    width = np.where(high > low, (high - low) / bins, 1.0)
+    counts = np.zeros((2, horizon * bins), dtype=np.int64)
+    offsets = np.arange(horizon) * bins
+
+    def count(daily, cumulative):
+        for i, values in enumerate((daily, cumulative)):
+            positions = np.clip(((values - low[i]) / width[i]).astype(np.int64), 0, bins - 1) + offsets
+            counts[i] += np.bincount(positions.ravel(), minlength=horizon * bins)
+
+    _reduce(*args, count)
+
+    index = (pd.date_range(start, periods=horizon, freq='D', name='Date') if start is not None
+             else pd.RangeIndex(1, horizon + 1, name='Day'))
+    frames = []
+    for i in range(2):
+        values = _histogram_quantiles(counts[i].reshape(horizon, bins), low[i], width[i], quantiles)
+        values = np.where((high[i] > low[i])[:, None], values, low[i][:, None])
+        frame = pd.DataFrame(values, index=index, columns=[quantile_label(q) for q in quantiles])
+        frame.insert(0, 'Mean', total[i] / paths)
+        frames.append(frame)
+    return frames[0], frames[1]
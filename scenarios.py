@@ -0,0 +1,62 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# Per-day event effects, in the order they are stacked in a calendar array.
+EVENTS = ['Holiday', 'Concert', 'Discount']
+
+
+def event_calendar(dates, holidays=(), concerts=(), promotions=()):
+    """Per-day event flags for a forecast horizon.
+
+    holidays and concerts are collections of dates; promotions are (start, end, discount %)
+    windows, inclusive on both ends. Returns a frame indexed by date with Holiday and
+    Concert flags and the Discount depth in percent on promotion days.
+    """
+    dates = pd.DatetimeIndex(dates)
+    calendar = pd.DataFrame(0.0, index=dates, columns=EVENTS)
+    calendar.loc[dates.isin(pd.DatetimeIndex(list(holidays))), 'Holiday'] = 1.0
+    calendar.loc[dates.isin(pd.DatetimeIndex(list(concerts))), 'Concert'] = 1.0
+    for start, end, discount in promotions:
+        window = (dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))
+        calendar.loc[window, 'Discount'] = np.maximum(calendar.loc[window, 'Discount'], float(discount))
+    return calendar
+
+
+def scenario_grid(holiday_uplift, concert_uplift, discount_uplift, calendars=1):
+    """Every combination of per-event-day uplifts (fractions) and calendar variants, one row per scenario.
+
+    discount_uplift is the uplift per percentage point of discount on a promotion day.
+    """
+    combinations = itertools.product(range(calendars), holiday_uplift, concert_uplift, discount_uplift)
+    return pd.DataFrame(list(combinations), columns=['Calendar', 'Holiday Uplift', 'Concert Uplift', 'Discount Uplift'])
+
+
+def evaluate_scenarios(baseline, calendars, grid):
+    """Apply every scenario in the grid to the baseline forecast in one broadcast.
+
+    baseline is the (days,) forecast, calendars one calendar frame or a list of them
+    (all covering the same days) and grid a frame from scenario_grid. Returns the
+    (scenarios x days) matrix of adjusted forecasts and a per-scenario summary. The
+    fitted model is never touched, so any number of scenarios costs one array operation.
+    """
+    baseline = np.asarray(baseline, dtype='float64')
+    if isinstance(calendars, pd.DataFrame):
+        calendars = [calendars]
+    # (calendars x days x events) effects; the discount column scales with discount depth.
+    effects = np.stack([calendar[EVENTS].to_numpy(dtype='float64') for calendar in calendars])
+    coefficients = grid[['Holiday Uplift', 'Concert Uplift', 'Discount Uplift']].to_numpy(dtype='float64')
+
+    uplift = 1 + np.einsum('sk,sdk->sd', coefficients, effects[grid['Calendar'].to_numpy()])
+    matrix = baseline[None, :] * uplift
+
+    totals = matrix.sum(axis=1)
+    baseline_total = baseline.sum()
+    summary = grid.assign(**{
+        'Total': totals,
+        'Uplift (%)': (totals / baseline_total - 1) * 100 if baseline_total else np.nan,
+        'Peak Day': matrix.max(axis=1),
+        'Peak Date': pd.DatetimeIndex(calendars[0].index)[matrix.argmax(axis=1)],
+    })
+    return matrix, summary
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+from analysis_index import ROLLUP_FREQUENCIES, AnalysisIndex
+from synthetic import generate
+
+
+@pytest.fixture(scope="module")
+def data():
+    data = generate(flavours=3, years=1, regions=2, missing_fraction=0.02, seed=1)
+    data = data.drop(columns="Region")
+    assert data["Promotion Type"].isna().any()
+    return data
+
+
+def _direct(data, granularity, y_axis, mean=False):
+    freq = ROLLUP_FREQUENCIES[granularity]
+    grouped = data.assign(Date=pd.to_datetime(data["Date"])).groupby(
+        pd.Grouper(key="Date", freq=freq, label="left", closed="left"))[y_axis]
+    return grouped.mean() if mean else grouped.sum()
+
+
+@pytest.mark.parametrize("granularity", list(ROLLUP_FREQUENCIES))
+@pytest.mark.parametrize("y_axis, mean", [("Sales Volume", False), ("Temperature", True)])
+def test_unfiltered_rollup_matches_groupby(data, granularity, y_axis, mean):
+    result = AnalysisIndex(data).rollup(granularity, y_axis).set_index("Date")[y_axis]
+    expected = _direct(data, granularity, y_axis, mean)
+    np.testing.assert_allclose(result.to_numpy(), expected.reindex(result.index).to_numpy())
+
+
+@pytest.mark.parametrize("granularity", list(ROLLUP_FREQUENCIES))
+def test_filtered_rollup_matches_mask(data, granularity):
+    index = AnalysisIndex(data)
+    filters = {"Flavour": [index.values("Flavour")[0]], "Promotion Type": ["None", "BOGO"]}
+    result = index.rollup(granularity, "Sales Volume", filters=filters).set_index("Date")["Sales Volume"]
+    expected = _direct(index.select(index.mask(filters=filters)), granularity, "Sales Volume")
+    np.testing.assert_allclose(result.to_numpy(), expected.reindex(result.index, fill_value=0).to_numpy())
@@ -1,8 +1,15 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+from analysis_index import ROLLUP_FREQUENCIES, AnalysisIndex
+from chart_rendering import build_figure
+from dataset_store import get_dataset_store
+from instrumentation import stage
 
-def trend_analysis(data):
+def _build_index(data):
+    with stage('analysis_index', rows=len(data)):
+        return AnalysisIndex(data)
+
+def trend_analysis(data, key=None):
     if data is not None:
         # Dashboard Title and subtitle
         st.markdown("<h1 style='text-align: center; color: #4CAF50;'>FLAVOUR FORECAST - Trend Analysis Dashboard</h1>", unsafe_allow_html=True)
@@ -20,57 +27,60 @@ def trend_analysis(data):
         x_axis = st.sidebar.selectbox("X-axis", data.columns, help="Select the attribute for the X-axis.")
         y_axis = st.sidebar.selectbox("Y-axis", data.columns, help="Select the attribute for the Y-axis.")
 
+        # Filters and rollups are answered from an index built once per stored dataset and shared by every session
+        if key is not None:
+            index = get_dataset_store().derived(key, 'analysis_index', _build_index)
+        else:
+            index = st.session_state.get('analysis_index')
+            if index is None or index.data is not data:
+                index = _build_index(data)
+                st.session_state['analysis_index'] = index
+
         # Date range filter
         st.sidebar.markdown("<h3 style='color: #FF7F50;'>Filter by Date</h3>", unsafe_allow_html=True)
-        if 'Date' in data.columns:
-            data['Date'] = pd.to_datetime(data['Date'])  # Ensure 'Date' column is datetime
-            start_date = st.sidebar.date_input("Start Date", data['Date'].min())
-            end_date = st.sidebar.date_input("End Date", data['Date'].max())
-            data = data[(data['Date'] >= pd.to_datetime(start_date)) & (data['Date'] <= pd.to_datetime(end_date))]
+        start_date = end_date = None
+        if index.dates is not None:
+            first_date, last_date = index.date_range
+            start_date = pd.to_datetime(st.sidebar.date_input("Start Date", first_date))
+            end_date = pd.to_datetime(st.sidebar.date_input("End Date", last_date))
+            granularity = st.sidebar.selectbox("Aggregate Dates By", ["None"] + list(ROLLUP_FREQUENCIES),
+                                               help="Plot one point per day, week or month instead of one per row.")
         else:
+            granularity = "None"
             st.sidebar.warning("Date filtering requires a 'Date' column in the dataset.")
 
         # Multi-column filters
         st.sidebar.markdown("<h3 style='color: #FF7F50;'>Multiple Filters</h3>", unsafe_allow_html=True)
         filter_columns = st.sidebar.multiselect("Select Columns to Filter By", options=data.columns)
 
-        # Apply filters for selected columns
+        # Collect the selected values for every filter column, then apply them in a single mask
+        filters = {}
         for column in filter_columns:
-            unique_values = data[column].unique()
-            selected_values = st.sidebar.multiselect(f"Select {column} values", unique_values, default=unique_values)
-            data = data[data[column].isin(selected_values)]
+            unique_values = list(index.values(column))
+            filters[column] = st.sidebar.multiselect(f"Select {column} values", unique_values, default=unique_values)
+
+        if granularity != "None" and index.can_answer(x_axis, y_axis, filters):
+            with stage('rollup') as record:
+                data = index.rollup(granularity, y_axis, start_date, end_date, filters)
+                record['rows'] = len(data)
+        else:
+            if granularity != "None":
+                st.sidebar.info("Date aggregation needs Date on the X-axis, a numeric Y-axis and filters on flavour/promotion columns only.")
+            with stage('filter') as record:
+                data = index.select(index.mask(start_date, end_date, filters))
+                record['rows'] = len(data)
 
         # Visualization type selection and plot generation
         st.markdown("<h4 style='color: #FF7F50;'>Visualization Results</h4>", unsafe_allow_html=True)
         st.markdown("<p style='font-size: 14px; color: gray;'>Here’s how your selected data looks based on the visualization settings.</p>", unsafe_allow_html=True)
 
-        # Generate plots based on selection
-        if visualization_type == "Bar Chart":
-            fig = px.bar(data, x=x_axis, y=y_axis, title=f"{y_axis} vs {x_axis} - Bar Chart")
-            fig.update_traces(textposition="inside", texttemplate="%{y}")
-
-        elif visualization_type == "Line Chart":
-            fig = px.line(data, x=x_axis, y=y_axis, title=f"{y_axis} vs {x_axis} - Line Chart")
-
-        elif visualization_type == "Pie Chart":
-            fig = px.pie(data, names=x_axis, values=y_axis, title=f"{y_axis} Distribution - Pie Chart", hole=0.3)  # Optional: Donut hole
-            fig.update_traces(textinfo="label+percent", insidetextorientation="radial")
-
-        elif visualization_type == "Heatmap":
-            correlation_matrix = data[[x_axis, y_axis]].corr()
-            fig = px.imshow(correlation_matrix, text_auto=True, title=f"Correlation Heatmap: {x_axis} and {y_axis}")
-
-            # Making inside heatmap values **bold**
-            fig.update_traces(
-                textfont=dict(size=16, color="white", family="Arial white")  # Bold white values inside heatmap
-            )
-
-        elif visualization_type == "Boxplot":
-            fig = px.box(data, x=x_axis, y=y_axis, title=f"{y_axis} by {x_axis} - Boxplot")
-
-        elif visualization_type == "Scatterplot":
-            fig = px.scatter(data, x=x_axis, y=y_axis, title=f"{y_axis} vs {x_axis} - Scatterplot")
-            fig.update_traces(mode="markers+text", textposition="top center", text=data[y_axis])
+        # Generate plots based on selection, reduced server-side to what the chart can display
+        try:
+            with stage('build_figure', rows=len(data)):
+                fig = build_figure(visualization_type, data, x_axis, y_axis)
+        except (TypeError, ValueError) as e:
+            st.error(f"A {visualization_type.lower()} cannot be drawn for {y_axis} against {x_axis}: {e}")
+            return
 
         # Apply layout customizations
         fig.update_layout(
@@ -89,11 +99,9 @@ def trend_analysis(data):
             )
         )
 
-        # Update layout for hover interaction
-        fig.update_traces(hovertemplate="%{x}: %{y}")
-
         # Display the interactive plot
-        st.plotly_chart(fig)
+        with stage('render_chart'):
+            st.plotly_chart(fig)
 
         # Textual summary based on the displayed visualization
         st.subheader("Textual Summary")
@@ -0,0 +1,36 @@
+"""Small helpers shared by the caches and stores."""
+import contextlib
+import functools
+import os
+import threading
+
+
+@contextlib.contextmanager
+def atomic_path(path):
+    """Yield a temporary path to write instead of path; on success it atomically replaces path.
+
+    The temporary name is unique per process and thread, so concurrent writers never share
+    one, and readers only ever see a complete file. On error the temporary file is removed.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+def process_singleton(factory):
+    """Decorator for a getter that builds its object on the first call and then always returns it."""
+    lock = threading.Lock()
+    instance = []
+
+    @functools.wraps(factory)
+    def get():
+        with lock:
+            if not instance:
+                instance.append(factory())
+            return instance[0]
+    return get
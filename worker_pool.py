@@ -0,0 +1,100 @@
+"""Process pools for CPU-bound model fits, with a time limit per task."""
+import multiprocessing
+import queue
+import time
+
+from threadpoolctl import threadpool_limits
+
+import instrumentation
+
+POLL_INTERVAL = 0.05
+# Modules the fork server imports once, so every worker it starts has them loaded already.
+PRELOAD = ['pipeline', 'statsmodels.tsa.statespace.sarimax']
+
+_started = None
+
+
+def init_worker(started=None):
+    # One BLAS thread per process, otherwise workers fight over cores and throughput stops scaling.
+    threadpool_limits(1)
+    # Only the parent writes the metrics file; a worker's stages go back to it with each result.
+    instrumentation.METRICS_FILE = None
+    global _started
+    _started = started
+
+
+def pool_context():
+    """Multiprocessing context for worker pools.
+
+    Pools are started from the multi-threaded Streamlit server and from the forecast
+    store's refresh threads, and forking such a process can copy a lock some other thread
+    holds into the child, where it never gets released. Workers are therefore forked from
+    a single-threaded fork server, or spawned where there is none.
+    """
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('spawn')
+    context = multiprocessing.get_context('forkserver')
+    context.set_forkserver_preload(PRELOAD)
+    return context
+
+
+def _call(index, function, args):
+    if _started is not None:
+        _started.put((index, time.time()))
+    instrumentation.reset()
+    try:
+        return function(*args), None, instrumentation.recent_stages()
+    except Exception as e:
+        return None, e, instrumentation.recent_stages()
+
+
+def map_with_timeout(function, tasks, workers, timeout):
+    """Run function(*args) for every args in tasks in a process pool, yielding (index, result, error) in task order.
+
+    Each task gets `timeout` seconds from the moment a worker starts it, so tasks queued
+    behind a slow one are not charged for the wait. A task that overruns is yielded with a
+    TimeoutError and the pool is replaced, which kills its stuck worker; results that had
+    already arrived are kept and every other unfinished task is resubmitted to the new pool.
+    error is the exception the task raised, or None.
+    """
+    tasks = list(tasks)
+    order = list(range(len(tasks)))
+    finished = {}
+    while order:
+        unfinished = [index for index in order if index not in finished]
+        context = pool_context()
+        started = context.Queue()
+        with context.Pool(max(1, min(workers, len(unfinished))), initializer=init_worker,
+                                  initargs=(started,)) as pool:
+            jobs = {index: pool.apply_async(_call, (index, function, tasks[index])) for index in unfinished}
+            start_times = {}
+            while order:
+                while True:
+                    try:
+                        index, started_at = started.get_nowait()
+                    except queue.Empty:
+                        break
+                    start_times[index] = started_at
+                for index, job in list(jobs.items()):
+                    if job.ready():
+                        del jobs[index]
+                        try:
+                            result, error, records = job.get()
+                        except Exception as e:
+                            result, error, records = None, e, []
+                        instrumentation.merge_stages(records)
+                        finished[index] = (result, error)
+                now = time.time()
+                overdue = [index for index, started_at in start_times.items()
+                           if index in jobs and now - started_at > timeout]
+                for index in overdue:
+                    del jobs[index]
+                    finished[index] = (None, TimeoutError(f"no result after {timeout}s"))
+                while order and order[0] in finished:
+                    index = order.pop(0)
+                    yield (index, *finished.pop(index))
+                if overdue:
+                    # Leaving the with-block terminates the pool and with it the stuck workers.
+                    break
+                if order:
+                    jobs[order[0]].wait(POLL_INTERVAL)